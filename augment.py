@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+# Batch augmentation replacing the per-image ImageDataGenerator transforms.
+# Usage in the notebook, with augmentation removed from the datagen:
+#   plain = ImageDataGenerator().flow_from_dataframe(...)
+#   train_generator = augment.AugmentedFlow(plain, seed=123, rescale=1./255.)
+#   model.fit(train_generator, steps_per_epoch=len(train_generator), ...)
+
+import collections
+import numpy as np
+from multiprocessing.pool import ThreadPool
+
+
+def random_params(rng, n, rotation_range=22, width_shift_range=0.3, height_shift_range=0.3,
+                  horizontal_flip=True, brightness=0.1, contrast=0.1, saturation=0.1):
+    # per image transform parameters for a batch of n
+    return {'angle': np.radians(rng.uniform(-rotation_range, rotation_range, n)),
+            'tx': rng.uniform(-width_shift_range, width_shift_range, n),
+            'ty': rng.uniform(-height_shift_range, height_shift_range, n),
+            'flip': np.where(horizontal_flip & (rng.random(n) < 0.5), -1.0, 1.0),
+            'brightness': rng.uniform(-brightness, brightness, n) * 255,
+            'contrast': rng.uniform(1 - contrast, 1 + contrast, n),
+            'saturation': rng.uniform(1 - saturation, 1 + saturation, n)}
+
+
+def affine_batch(batch, params):
+    # rotate/shift/flip a whole (n, h, w, c) batch with one gather, nearest
+    # neighbour sampling and 'nearest' fill (edge pixels are repeated)
+    n, h, w = batch.shape[:3]
+    cx, cy = (w - 1) / 2, (h - 1) / 2
+    ys, xs = np.mgrid[0:h, 0:w].astype(np.float32)
+    cos = np.cos(params['angle']).astype(np.float32)[:, None, None]
+    sin = np.sin(params['angle']).astype(np.float32)[:, None, None]
+    dx = xs[None] - cx - (params['tx'] * w).astype(np.float32)[:, None, None]
+    dy = ys[None] - cy - (params['ty'] * h).astype(np.float32)[:, None, None]
+    src_x = (cos * dx + sin * dy) * params['flip'].astype(np.float32)[:, None, None] + cx
+    src_y = -sin * dx + cos * dy + cy
+    src_x = np.clip(np.rint(src_x), 0, w - 1).astype(np.intp)
+    src_y = np.clip(np.rint(src_y), 0, h - 1).astype(np.intp)
+    return batch[np.arange(n)[:, None, None], src_y, src_x]
+
+
+def colour_batch(batch, params):
+    # brightness, contrast and saturation jitter, uint8 in and out
+    x = batch.astype(np.float32)
+    gray = x.mean(axis=3, keepdims=True)
+    x = gray + params['saturation'][:, None, None, None] * (x - gray)
+    mean = x.mean(axis=(1, 2, 3), keepdims=True)
+    x = mean + params['contrast'][:, None, None, None] * (x - mean) + params['brightness'][:, None, None, None]
+    return np.clip(np.rint(x), 0, 255).astype(np.uint8)
+
+
+def augment_batch(batch, seed, **kwargs):
+    # seed is anything np.random.default_rng accepts, e.g. (seed, batch no)
+    rng = np.random.default_rng(seed)
+    params = random_params(rng, len(batch), **kwargs)
+    return colour_batch(affine_batch(batch, params), params)
+
+
+class AugmentedFlow:
+    # Wraps an iterator of (x, y) batches such as flow_from_dataframe output
+    # and can be passed to model.fit in its place: len() and attributes like
+    # n, batch_size and class_indices are those of the wrapped flow.
+    # Batches are augmented in a thread pool (the numpy ops release the GIL)
+    # with at most `prefetch` in flight. Batch i always uses seed (seed, i),
+    # so results do not depend on worker timing.
+
+    def __init__(self, flow, seed=0, workers=4, prefetch=8, rescale=None, **kwargs):
+        self.flow = flow
+        self.seed = seed
+        self.workers = workers
+        self.prefetch = prefetch
+        self.rescale = rescale
+        self.kwargs = kwargs
+        self._source = None
+        self._pool = None
+        self._pending = collections.deque()
+        self._count = 0
+
+    def __getattr__(self, name):
+        # only called for attributes not found on the wrapper
+        if name == 'flow':
+            raise AttributeError(name)
+        return getattr(self.flow, name)
+
+    def __len__(self):
+        return len(self.flow)
+
+    def _work(self, i, x, y):
+        x = augment_batch(np.asarray(x).astype(np.uint8), (self.seed, i), **self.kwargs)
+        return (x * self.rescale if self.rescale is not None else x), y
+
+    def _submit(self):
+        # queue the next batch of the wrapped flow, False when it is exhausted
+        try:
+            x, y = next(self._source)
+        except StopIteration:
+            return False
+        self._pending.append(self._pool.apply_async(self._work, (self._count, x, y)))
+        self._count += 1
+        return True
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._pool is None:
+            self._pool = ThreadPool(self.workers)
+            self._source = iter(self.flow)
+        while len(self._pending) < self.prefetch and self._submit():
+            pass
+        if not self._pending:
+            self.close()
+            raise StopIteration
+        return self._pending.popleft().get()
+
+    def close(self):
+        # flows from ImageDataGenerator never end, close the pool when done
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+        self._pending.clear()
@@ -1,4 +1,5 @@
 import cv2
+import math
 import matplotlib.pyplot as plt
 import numpy as np
 import os
@@ -32,7 +33,8 @@ def _crop_image(aspect_ratio, img):
         padding = int((im_w - im_w_target) / 2)
         return img[:, padding:(im_w-padding), :]
     else:
-        return ValueError('Illegal state', aspect_ratio, img.shape)
+        # already at the aspect ratio
+        return img
 
 def _cv2_resize(img, dsize, mode='none', interpolation=cv2.INTER_AREA, color=(128, 128, 128)):
     preimage = None
@@ -58,17 +60,60 @@ def _segmentimage(img, wratio, hratio):
     return (top_left, top_right, bot_left, bot_right)
 
 
-def bg_convert(src_file, dst_dir, width=2520, height=1080):
+# Blender's default camera: 50mm lens on a 36mm sensor
+BLENDER_DEFAULT_FOV = 2 * math.degrees(math.atan(36.0 / (2 * 50.0)))
+
+
+def bg_target_size(res_x, res_y, fov=BLENDER_DEFAULT_FOV, dist=200, scale=200, aspect_ratio=(2520, 1080), oversample=1.0):
+    # Size of the wall image such that one texel maps to about one output pixel.
+    # The wall planes of `blender_render.add_bg_image` are `scale` units high and
+    # sit `dist` units from the origin, which is the closest the camera gets.
+    fov_rad = math.radians(fov)
+    if res_x >= res_y:
+        view_w = 2 * dist * math.tan(fov_rad / 2)
+    else:
+        view_w = 2 * dist * math.tan(fov_rad / 2) * res_x / res_y
+    px_per_unit = res_x / view_w * oversample
+    height = int(math.ceil(scale * px_per_unit))
+    width = int(math.ceil(height * aspect_ratio[0] / aspect_ratio[1]))
+    # never upscale beyond the original target size
+    return (min(width, aspect_ratio[0]), min(height, aspect_ratio[1]))
+
+
+def bg_floor_size(res_x, res_y, fov=BLENDER_DEFAULT_FOV, floor_height=17.25, scale=200, max_size=2520, oversample=1.0):
+    # Size of the square floor image. The floor of `blender_render.add_floor_image`
+    # is `floor_height` units below the camera (10 + half of a typical ~14.5 unit
+    # model), so its nearest visible point, at the bottom edge of the frame, is
+    # much closer to the camera than the walls and needs more texels per unit.
+    fov_rad = math.radians(fov)
+    if res_x >= res_y:
+        half_w = math.tan(fov_rad / 2)
+        half_h = half_w * res_y / res_x
+    else:
+        half_h = math.tan(fov_rad / 2)
+        half_w = half_h * res_x / res_y
+    dist = floor_height / half_h
+    px_per_unit = res_x / (2 * dist * half_w) * oversample
+    return min(int(math.ceil(scale * px_per_unit)), max_size)
+
+
+def bg_convert(src_file, dst_dir, width=2520, height=1080, floor_size=None, png_compression=0):
+    # png_compression=0 writes uncompressed png which blender decodes fastest
+    floor_size = width if floor_size is None else floor_size
     idx = uuid.uuid1() 
     dst_name = str(idx.hex)
+    params = [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
     # bg
-    img = cv2.imread(src_file)
-    resized = _cv2_resize(img, (width, height), mode='crop')
+    img = _crop_image((width, height), cv2.imread(src_file))
+    resized = _cv2_resize(img, (width, height), mode='none')
     out = os.path.join(dst_dir, dst_name + '-bg.png')
-    cv2.imwrite(out, resized)
-    # floor
-    tl, tr, bl, br = _segmentimage(resized, 0.0, 0.8)
-    resized = _cv2_resize(br, (width, width), mode='none')
+    cv2.imwrite(out, resized, params)
+    # floor, cut from the full resolution crop as the floor needs more texels
+    # than the small wall image has. Not wider than the source strip, that
+    # would add pixels but no detail
+    tl, tr, bl, br = _segmentimage(img, 0.0, 0.8)
+    floor_size = min(floor_size, br.shape[1])
+    resized = _cv2_resize(br, (floor_size, floor_size), mode='none')
     out = os.path.join(dst_dir, dst_name + '-fl.png')
-    cv2.imwrite(out, resized)
+    cv2.imwrite(out, resized, params)
     return dst_name
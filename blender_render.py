@@ -1,9 +1,12 @@
+import addon_utils
 import bpy
+import json
 import math
 import mathutils
 import ntpath
 import os
 import sys
+from bpy_extras.object_utils import world_to_camera_view
 
 
 
@@ -59,12 +62,15 @@ def add_bg_image(filename, dist=200, zdist=50, scale=200):
              [0,  dist,  -zdist],
              [dist,  0,  -zdist]]
     # load palnes
+    planes = []
     for i in range(4):
         bpy.ops.import_image.to_plane(files=[{"name":basename}], directory=dirname, relative=False)
         plane_obj = bpy.context.active_object
         plane_obj.scale = (scale, scale, 1)
         plane_obj.rotation_euler = [math.radians(a) for a in rots[i]]
         plane_obj.location = locs[i]
+        planes.append(plane_obj)
+    return planes
 
     
 def add_floor_image(filename, zdist, scale=200):
@@ -76,9 +82,31 @@ def add_floor_image(filename, zdist, scale=200):
     rot_transform = [math.radians(a) for a in (180.0, 180.0, -180.0)]
     plane_obj.rotation_euler = rot_transform
     plane_obj.location = (0, 0, zdist)
+    return plane_obj
 
 
-def setup_scene(obj, scene, cam_radius, front_angle=0, light_radius=150, clip_end=500):
+def enable_addons():
+    # images-as-planes is not enabled with --factory-startup
+    if not addon_utils.check('io_import_images_as_planes')[1]:
+        addon_utils.enable('io_import_images_as_planes')
+
+
+def setup_static(scene, clip_end=500, format='PNG'):
+    # scene state which is the same for every job, baked into the template
+    scene.objects.get('Camera').data.clip_end = clip_end
+    lamp = scene.objects.get('Light')
+    lamp.data.type = 'AREA'
+    lamp.data.energy = 400000
+    scene.render.image_settings.file_format=format
+    scene['ffx_template'] = True
+
+
+def save_template(filename):
+    setup_static(bpy.data.scenes[0])
+    bpy.ops.wm.save_as_mainfile(filepath=filename)
+
+
+def setup_scene(obj, scene, cam_radius, front_angle=0, light_radius=150):
     # TODO: setup cam location based on obj size
     # setup values
     cam_angle = [math.radians(a) for a in (-90, 0, -front_angle)]
@@ -89,23 +117,83 @@ def setup_scene(obj, scene, cam_radius, front_angle=0, light_radius=150, clip_en
     camera = scene.objects.get('Camera')
     camera.location = cam_location    
     camera.rotation_euler = cam_angle
-    camera.data.clip_end = clip_end
     # setup lamp
     lamp = camera = scene.objects.get('Light')
     lamp.location = lamp_location
     lamp.rotation_euler = cam_angle
-    lamp.data.type = 'AREA'
-    lamp.data.energy = 400000
 
 
-def render_scene(scene, filename, res_x=300, res_y=300, format='PNG'):
-    scene.render.image_settings.file_format=format
+def place_models(objs, front_angle, gap=2.0):
+    # put the models in a row across the view direction so that neither
+    # they nor their boxes on screen overlap, returns the row length
+    theta = math.radians(front_angle)
+    axis = (math.cos(theta), -math.sin(theta))
+    widths = [max(obj.dimensions[0], obj.dimensions[1]) for obj in objs]
+    span = sum(widths) + gap*(len(objs)-1)
+    pos = -span/2
+    for obj, width in zip(objs, widths):
+        center = pos + width/2
+        obj.location = (axis[0]*center, axis[1]*center, 0)
+        pos += width + gap
+    return span
+
+
+def fit_radius(scene, objs, span, res_x, res_y, margin=1.15):
+    # camera distance at which a row `span` wide (and the tallest model) fits
+    # the field of view, the nearest faces are up to half a model closer
+    angle = scene.objects.get('Camera').data.angle
+    aspect = res_x / res_y
+    # with sensor fit AUTO the angle applies to the longer image side
+    hfov = angle if aspect >= 1 else 2*math.atan(math.tan(angle/2)*aspect)
+    vfov = angle if aspect <= 1 else 2*math.atan(math.tan(angle/2)/aspect)
+    depth = max(max(obj.dimensions[0], obj.dimensions[1]) for obj in objs)
+    height = max(obj.dimensions[2] for obj in objs)
+    fit = max(span/2/math.tan(hfov/2), height/2/math.tan(vfov/2))
+    return margin*fit + depth/2
+
+
+def object_boxes(scene, objs, res_x, res_y):
+    # pixel boxes (x0, y0, x1, y1) of the objects in the camera image
+    camera = scene.objects.get('Camera')
+    bpy.context.view_layer.update()
+    boxes = []
+    for obj in objs:
+        pts = [world_to_camera_view(scene, camera, obj.matrix_world @ mathutils.Vector(c)) for c in obj.bound_box]
+        pts = [p for p in pts if p.z > 0]
+        if not pts:
+            boxes.append(None)
+            continue
+        x0 = min(max(min(p.x for p in pts), 0.0), 1.0) * res_x
+        x1 = min(max(max(p.x for p in pts), 0.0), 1.0) * res_x
+        y0 = (1.0 - min(max(max(p.y for p in pts), 0.0), 1.0)) * res_y
+        y1 = (1.0 - min(max(min(p.y for p in pts), 0.0), 1.0)) * res_y
+        boxes.append([x0, y0, x1, y1])
+    return boxes
+
+
+def render_scene(scene, filename, res_x=300, res_y=300):
     scene.render.resolution_x = res_x
     scene.render.resolution_y = res_y
     scene.render.filepath = filename
     bpy.ops.render.render(write_still=True)
 
 
+def render_mask(scene, filename, planes, res_x=300, res_y=300, size=64):
+    # small RGBA render of the models alone, alpha is the model coverage
+    render = scene.render
+    color_mode = render.image_settings.color_mode
+    for plane in planes:
+        plane.hide_render = True
+    render.film_transparent = True
+    render.image_settings.color_mode = 'RGBA'
+    scale = min(1.0, size / max(res_x, res_y))
+    render_scene(scene, filename, max(1, round(res_x*scale)), max(1, round(res_y*scale)))
+    for plane in planes:
+        plane.hide_render = False
+    render.film_transparent = False
+    render.image_settings.color_mode = color_mode
+
+
 def run(idx):
     print('INFO: Getting parameters')
     #out_name = '%03d' % idx
@@ -117,24 +205,51 @@ def run(idx):
     img_path = sys.stdin.readline().rstrip('\n')
     out_path = sys.stdin.readline().rstrip('\n')
     angle = int(sys.stdin.readline().rstrip('\n'))
+    # optional 'res_x res_y' line
+    res = sys.stdin.readline().split()
+    res_x, res_y = (int(res[0]), int(res[1])) if len(res) == 2 else (300, 300)
+    # optional coverage mask path
+    mask_path = sys.stdin.readline().rstrip('\n')
 
 
     print('INFO: Loading models')
+    enable_addons()
+    if not bpy.data.scenes[0].get('ffx_template'):
+        setup_static(bpy.data.scenes[0])
     remove_obj_and_mesh(bpy.context)
-    xobj = load_model(obj_path, tex_path)    
-    gen_scale = max(xobj.dimensions) / 14.5
+    # several tab separated models make a composite scene
+    names = out_name.split('\t')
+    objs = [load_model(o, t) for o, t in zip(obj_path.split('\t'), tex_path.split('\t'))]
+    gen_scale = max(max(obj.dimensions) for obj in objs) / 14.5
+    cam_radius = 30.0 + 10*gen_scale
+    if len(objs) > 1:
+        span = place_models(objs, angle)
+        cam_radius = max(cam_radius, fit_radius(bpy.data.scenes[0], objs, span, res_x, res_y))
+        if cam_radius >= 200:
+            print('WARN: Scene too wide, camera outside the background, radius=%.1f' % cam_radius)
 
     print('INFO: Loading backgrounds')
-    add_bg_image(img_path + '-bg.png')
-    add_floor_image(img_path + '-fl.png', 10+xobj.dimensions[2]/2)
+    planes = add_bg_image(img_path + '-bg.png')
+    planes.append(add_floor_image(img_path + '-fl.png', 10+max(obj.dimensions[2] for obj in objs)/2))
 
     print('INFO: Rendering scenes')
     #fa = [0, 45, 90, 135, 180, -135, -90, -45]
     fa = [angle]
     for i in range(len(fa)):
-        setup_scene(xobj, bpy.data.scenes[0], 30.0 + 10*gen_scale, front_angle=fa[i])
-        render_scene(bpy.data.scenes[0], out_path)
+        setup_scene(objs[0], bpy.data.scenes[0], cam_radius, front_angle=fa[i])
+        render_scene(bpy.data.scenes[0], out_path, res_x, res_y)
+        if mask_path:
+            render_mask(bpy.data.scenes[0], mask_path, planes, res_x, res_y)
+    if len(objs) > 1:
+        boxes = object_boxes(bpy.data.scenes[0], objs, res_x, res_y)
+        with open(out_path + '.json', 'w') as fd:
+            json.dump([{'name': n, 'box': b} for n, b in zip(names, boxes)], fd)
     print('INFO: Rendering scenes')
 
 
-run(0)
\ No newline at end of file
+# blender --background --factory-startup --python blender_render.py -- --template out.blend
+argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+if len(argv) == 2 and argv[0] == '--template':
+    save_template(argv[1])
+else:
+    run(0)
\ No newline at end of file
@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+
+# test_extraction.py is a manual script for real game files, not a test
+collect_ignore = ['thirdparty_xentax/test_extraction.py']
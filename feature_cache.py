@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+# Usage: python feature_cache.py <dist_path> <cache_dir>
+# Runs a frozen backbone over img_map.csv once and stores the embeddings in
+# a memory mapped array, then fits a classifier head on them.
+
+import cv2
+import hashlib
+import json
+import logging
+import numpy as np
+import os
+import pandas as pd
+import sys
+
+BACKBONES = {'inception_v3': ('inception_v3', 'InceptionV3', (299, 299)),
+             'mobilenet_v2': ('mobilenet_v2', 'MobileNetV2', (224, 224))}
+
+
+def dataset_key(df, backbone, weights):
+    # changes whenever an image, a label, the backbone or its weights change
+    h = hashlib.sha1('{} {}'.format(backbone, weights).encode())
+    for path, cls in zip(df['id'], df['cls']):
+        st = os.stat(path)
+        h.update('{} {} {} {}\n'.format(path, cls, st.st_size, st.st_mtime_ns).encode())
+    return h.hexdigest()[:16]
+
+
+def load_backbone(backbone, weights='imagenet'):
+    import tensorflow as tf
+    module, cls, shape = BACKBONES[backbone]
+    app = getattr(tf.keras.applications, module)
+    model = getattr(app, cls)(weights=weights, include_top=False, pooling='avg', input_shape=shape + (3,))
+    model.trainable = False
+    return model, app.preprocess_input, shape
+
+
+def load_images(paths, shape):
+    batch = np.zeros((len(paths),) + shape + (3,), dtype=np.float32)
+    for i, path in enumerate(paths):
+        img = cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2RGB)
+        batch[i] = cv2.resize(img, shape, interpolation=cv2.INTER_AREA)
+    return batch
+
+
+def build_cache(df, cache_dir, backbone='inception_v3', weights='imagenet', batch_size=32):
+    # Returns (features, index). The features are memory mapped from
+    # <cache_dir>/<key>/features.npy and only computed when the key changed.
+    key = dataset_key(df, backbone, weights)
+    out_dir = os.path.join(cache_dir, key)
+    feature_file = os.path.join(out_dir, 'features.npy')
+    index_file = os.path.join(out_dir, 'index.csv')
+    if os.path.exists(os.path.join(out_dir, 'meta.json')):
+        logging.info('Feature cache hit, key=' + key)
+        return np.load(feature_file, mmap_mode='r'), pd.read_csv(index_file, index_col=0)
+    os.makedirs(out_dir, exist_ok=True)
+    model, preprocess, shape = load_backbone(backbone, weights)
+    index = pd.DataFrame({'id': df['id'].values, 'cls': df['cls'].values})
+    features = np.lib.format.open_memmap(feature_file, mode='w+', dtype=np.float32,
+                                         shape=(len(index), model.output_shape[-1]))
+    for start in range(0, len(index), batch_size):
+        paths = index['id'].values[start:start + batch_size]
+        features[start:start + len(paths)] = model.predict_on_batch(preprocess(load_images(paths, shape)))
+    features.flush()
+    index.to_csv(index_file)
+    # written last, marks the cache as complete
+    with open(os.path.join(out_dir, 'meta.json'), 'w') as fd:
+        json.dump({'backbone': backbone, 'weights': weights, 'rows': len(index)}, fd)
+    logging.info('Feature cache built, key={} rows={}'.format(key, len(index)))
+    return np.load(feature_file, mmap_mode='r'), index
+
+
+def train_head(features, index, hidden=256, epochs=20, test_size=0.2, seed=123):
+    # small dense head on the cached embeddings, returns (model, val accuracy)
+    import tensorflow as tf
+    classes = sorted(index['cls'].unique())
+    y = index['cls'].map({c: i for i, c in enumerate(classes)}).values
+    rng = np.random.RandomState(seed)
+    msk = rng.rand(len(y)) >= test_size
+    x = np.asarray(features)
+    layers = [tf.keras.layers.Dense(hidden, activation='relu'), tf.keras.layers.Dropout(0.3)] if hidden else []
+    model = tf.keras.Sequential(layers + [tf.keras.layers.Dense(len(classes), activation='softmax')])
+    model.compile(optimizer='adam', loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+    model.fit(x[msk], y[msk], epochs=epochs, batch_size=256, verbose=0)
+    _, acc = model.evaluate(x[~msk], y[~msk], verbose=0)
+    return model, acc
+
+
+if __name__ == '__main__':
+    dist_path, cache_dir = sys.argv[1], sys.argv[2]
+    df = pd.read_csv(os.path.join(dist_path, 'img_map.csv'))
+    features, index = build_cache(df, cache_dir)
+    _, acc = train_head(features, index)
+    print('validation accuracy: {:.3f}'.format(acc))
@@ -3,56 +3,57 @@
 import logging
 import os
 import pandas as pd
+import random
 import shutil
-import subprocess
 import tempfile
-from multiprocessing.pool import ThreadPool
 
 import bg_convert
+import frame_prune
+import functools
+import json
+import mesh_lod
+import model_dedup
+import multires
+import pipeline
+import render_cost
+import render_runner
+import texture_lod
+import viewpoints
 
+from gather import model_gather, model_gather_vbf
 from thirdparty_xentax import phyre
 
-def model_gather(chr_path, filter_dirs=[]):
-    model_data = []
-    sub_dirs = os.listdir(chr_path) if len(filter_dirs) == 0 else filter_dirs
-    for sub_dir in sub_dirs:
-        sub_dir_path = os.path.join(chr_path, sub_dir)
-        models = os.listdir(sub_dir_path)
-        for model in models:
-            mesh_file = os.path.join(sub_dir_path, model, 'mdl', 'd3d11', model + '.dae.phyre')
-            texture_file = os.path.join(sub_dir_path, model, 'tex', 'd3d11', model + '.dds.phyre')
-            if os.path.exists(mesh_file) and os.path.exists(texture_file):
-                model_data.append({'name': sub_dir + '_' + model, 'mesh': mesh_file,'texture': texture_file})
-            else:
-                logging.warning('Files not present: ' + mesh_file + ' or ' + texture_file)
-    return model_data
-
-def model_extract(model_data):
-    tmp_dir = tempfile.mkdtemp()
-    logging.info('Extracting models into directory, dir=' + tmp_dir)
-    for model in model_data:
-        out_mesh = os.path.join(tmp_dir, model['name'] + '.obj')
-        out_texture = os.path.join(tmp_dir, model['name'] + '.dds')
+
+def extract_model(model, tmp_dir, render_res=None, cache_dir=None, tri_budget=None, tex_oversample=1.0):
+    # with render_res and cache_dir set, textures are reduced to the mip level
+    # matching the model's size on screen (times tex_oversample texels per
+    # pixel) and cached across runs. With tri_budget set as well, meshes are
+    # decimated to that many faces and cached.
+    use_cache = render_res is not None and cache_dir is not None
+    out_mesh = os.path.join(tmp_dir, model['name'] + '.obj')
+    out_texture = os.path.join(tmp_dir, model['name'] + '.dds')
+    if use_cache and tri_budget is not None:
+        shutil.copyfile(mesh_lod.prepare_mesh(model, os.path.join(cache_dir, 'mesh'), tri_budget), out_mesh)
+    else:
         phyre.extractMesh(model['mesh'], out_mesh, debug=False)
+    if use_cache:
+        extent = texture_lod.model_extent(out_mesh)
+        shutil.copyfile(texture_lod.prepare_texture(model, os.path.join(cache_dir, 'tex'), render_res, tex_oversample, extent), out_texture)
+    else:
         phyre.extractDDS(model['texture'], out_texture, debug=False)
-    return tmp_dir
-
-
-def render_job(model_name, obj_path, texture_path, bg_path, dist_path, angle):
-    print('{} {} {}'.format(angle, bg_path, model_name))
-    instr ='\n'.join([model_name, obj_path, texture_path, bg_path, dist_path, angle]).encode()    
-    out = subprocess.check_output("blender --background --python blender_render.py", stderr=subprocess.STDOUT, input=instr, shell=True)
-    logging.info('Blender out=' + str(out))
-    #print(out.decode('utf-8'))
+    return model
 
-
-def make_bgs(bg_path, tmp_dir):    
-    files = os.listdir(bg_path)    
-    outs = []
-    for file in files:
-        src_file = os.path.join(bg_path, file)
-        outs.append(bg_convert.bg_convert(src_file, tmp_dir))
-    return outs
+def extract_and_fingerprint(model, tmp_dir, render_res=None, cache_dir=None, tri_budget=None, tex_oversample=1.0, angles=None, n_views=8):
+    # pipeline stage, runs in a worker process. With angles set, the n_views
+    # most informative of them are picked into model['angles'] here as well
+    extract_model(model, tmp_dir, render_res, cache_dir, tri_budget, tex_oversample)
+    model = dict(model)
+    obj_path = os.path.join(tmp_dir, model['name'] + '.obj')
+    model['fingerprint'] = model_dedup.fingerprint(model, obj_path, os.path.join(tmp_dir, model['name'] + '.dds'))
+    if angles is not None:
+        model['angles'] = viewpoints.select_for_obj(obj_path, angles, n_views)
+        logging.info('Viewpoints, model={} angles={}'.format(model['name'], model['angles']))
+    return model
 
 def make_model_map(map_file):
     model_map = {}
@@ -79,16 +80,90 @@ def get_triplet(angles, bgs, models):
                 yield (a, b, m)
 
 
+def render_plan(triplets, tmp_dir, bg_tmp_dir, dist_path, render_res=(300, 300), mask_dir=None):
+    # lazily turn (angle, bg, model) triplets into render jobs, with a mask
+    # dir blender also writes a model only coverage mask per frame
+    for angle, bg, model in triplets:
+        model_name = model['name']
+        obj_path = os.path.join(tmp_dir, model_name + '.obj')
+        texture_path = os.path.join(tmp_dir, model_name + '.dds')
+        bg_alt_path = os.path.join(bg_tmp_dir, bg)
+        out_path = os.path.join(dist_path, '{}_{}_{}.png'.format(model_name, bg, angle))
+        mask_path = frame_prune.mask_path(mask_dir, out_path) if mask_dir else ''
+        yield {'model': model,
+               'args': [model_name, obj_path, texture_path, bg_alt_path, out_path, str(angle),
+                        '{} {}'.format(*render_res), mask_path],
+               'angle': angle,
+               'out': out_path}
+
+
+def scene_plan(n_scenes, per_scene, angles, bgs, models, tmp_dir, bg_tmp_dir, dist_path, render_res=(300, 300), seed=0):
+    # composite scenes of `per_scene` different models, blender writes the
+    # per object boxes to <out>.json
+    rng = random.Random(seed)
+    for i in range(n_scenes):
+        scene_models = rng.sample(models, min(per_scene, len(models)))
+        angle = rng.choice(angles)
+        bg = rng.choice(bgs)
+        names = [m['name'] for m in scene_models]
+        out_path = os.path.join(dist_path, 'scene{:05d}_{}_{}.png'.format(i, bg, angle))
+        yield {'model': scene_models[0],
+               'models': scene_models,
+               'args': ['\t'.join(names),
+                        '\t'.join(os.path.join(tmp_dir, n + '.obj') for n in names),
+                        '\t'.join(os.path.join(tmp_dir, n + '.dds') for n in names),
+                        os.path.join(bg_tmp_dir, bg), out_path, str(angle),
+                        '{} {}'.format(*render_res)],
+               'angle': angle,
+               'out': out_path,
+               'labels': []}
+
+
+def box_rows(jobs, model_map, model_groups=None):
+    # one (id, cls, x0, y0, x1, y1) row per visible object and class. Like the
+    # classification index, a representative gets the classes of every model
+    # in its duplicate group (model_dedup.GroupIndex.groups)
+    rows = {'id': [], 'cls': [], 'x0': [], 'y0': [], 'x1': [], 'y1': []}
+    for job in jobs:
+        if not os.path.exists(job['out'] + '.json'):
+            logging.warning('Boxes missing for scene, out=' + job['out'])
+            continue
+        with open(job['out'] + '.json') as fd:
+            objects = json.load(fd)
+        for obj in objects:
+            if obj['box'] is None or obj['box'][2] <= obj['box'][0] or obj['box'][3] <= obj['box'][1]:
+                continue
+            members = model_groups.get(obj['name'], [obj['name']]) if model_groups else [obj['name']]
+            for cls in sorted(set(model_map[m] for m in members)):
+                rows['id'].append(job['out'])
+                rows['cls'].append(cls)
+                for key, val in zip(['x0', 'y0', 'x1', 'y1'], obj['box']):
+                    rows[key].append(val)
+    return rows
+
+
 if __name__ == '__main__':
     # get available models
     chr_path = '/media/rishin/20ACFF83ACFF5230/Users/rishin/Desktop/ffxx/ffx_data/gamedata/ps3data/chr'
     bg_path = '/home/rishin/workspace/ffx-ai/assets/'
     dist_path = '/home/rishin/workspace/ffx-ai/dist'
     map_path = '/home/rishin/workspace/ffx-ai/enemy_map.txt'
+    cache_path = '/home/rishin/workspace/ffx-ai/cache'
     # 
     angles_front = [15, 30, 45, 60, 75, 345, 330, 315, 300, 285] # [15, 30, 45, 60, 75, -15, -30, -45, -60, -75]
     angles_back = [105, 120, 135, 150, 165, 255, 240, 225, 210, 195] # [105, 120, 135, 150, 165, -105, -120, -135, -150, -165]
     all_angles = angles_front + angles_back
+    # only the n_views most informative, distinct angles are rendered per model
+    n_views = 8
+    # rendered once at render_res, downsampled to every target_res
+    render_res = (300, 300)
+    target_res = [(299, 299), (224, 224)]
+    # texels per output pixel kept in the reduced textures
+    tex_oversample = 1.0
+    # composite scenes with several monsters for detection training, off
+    # unless set (e.g. 2000)
+    n_scenes = 0
+    models_per_scene = 3
     #
     model_map = make_model_map(map_path)
     model_filter = model_map.keys()
@@ -96,37 +171,77 @@ if __name__ == '__main__':
     #
     model_data = model_gather(chr_path, ['mon'])
     model_data_filtered = [m for m in model_data if m['name'] in model_filter]
-    tmp_dir = model_extract(model_data_filtered)
-    #print(model_data)
-    print(tmp_dir)
-    #
+    tmp_dir = tempfile.mkdtemp()
     bg_tmp_dir = tempfile.mkdtemp()
-    bg_data = make_bgs(bg_path, bg_tmp_dir)
-    #print(bg_data)
+    mask_dir = tempfile.mkdtemp()
+    print(tmp_dir)
     print(bg_tmp_dir)
-    # parrallelise jobs
-    tp = ThreadPool(12)
-    # render models
-    xy_map = {'id': [], 'cls': []}
-    xxx = 0
-    for angle, bg, model in get_triplet(all_angles, bg_data, model_data_filtered):
-        model_name = model['name']
-        obj_path = os.path.join(tmp_dir, model_name + '.obj')
-        texture_path = os.path.join(tmp_dir, model_name + '.dds')
-        bg_alt_path = os.path.join(bg_tmp_dir, bg)
-        out_path = os.path.join(dist_path, '{}_{}_{}.png'.format(model_name, bg, angle))
+    bg_files = [os.path.join(bg_path, f) for f in os.listdir(bg_path)]
+    bg_width, bg_height = bg_convert.bg_target_size(*render_res)
+    bg_floor = bg_convert.bg_floor_size(*render_res)
+    # schedule expensive models first so they don't straggle at the end, the
+    # cost comes from the phyre headers so no extraction is needed for it
+    scheduler = render_runner.CoreScheduler()
+    stats = {m['name']: render_cost.probe_stats(m) for m in model_data_filtered}
+    timings_path = os.path.join(cache_path, 'timings.json')
+    timings = render_cost.load_timings(timings_path)
+    stubs = [{'model': m} for m in model_data_filtered for _ in range(n_views * len(bg_files))]
+    stubs, est_time = render_cost.longest_first(stubs, stats, timings, scheduler.target)
+    print('Estimated render time: {:.1f} min for {} jobs'.format(est_time / 60, len(stubs)))
+    model_order = list({j['model']['name']: j['model'] for j in stubs}.values())
+    model_cost = {j['model']['name']: j['cost'] for j in stubs}
+    # render one representative per group of identical looking models
+    group_index = model_dedup.GroupIndex()
+    def accept(model):
+        return group_index.add(model['fingerprint']) == model['name']
+    # extraction, background prep and rendering run as a streamed pipeline,
+    # a model's jobs start as soon as it and a background are ready. Models
+    # are submitted longest first and the queued jobs are rendered by cost
+    render_runner.build_template()
+    def post(job):
+        job['res'] = multires.write_resolutions(job['out'], target_res, dist_path)
+    def plan(model, bgs):
+        for job in render_plan(get_triplet(model['angles'], bgs, [model]), tmp_dir, bg_tmp_dir, dist_path, render_res, mask_dir):
+            job['cost'] = model_cost[model['name']]
+            yield job
+    ready = {'models': [], 'bgs': []}
+    result = pipeline.run(model_order, bg_files,
+                          functools.partial(extract_and_fingerprint, tmp_dir=tmp_dir, render_res=render_res, cache_dir=cache_path,
+                                            tri_budget=mesh_lod.triangle_budget(render_res),
+                                            tex_oversample=tex_oversample, angles=all_angles, n_views=n_views),
+                          functools.partial(bg_convert.bg_convert, dst_dir=bg_tmp_dir, width=bg_width, height=bg_height, floor_size=bg_floor),
+                          plan,
+                          accept=accept, ready=ready, timeout=600, retries=1, scheduler=scheduler, post=post)
+    model_groups = group_index.groups
+    def labels(model_name, angle):
         class_suffix = '_front' if angle in angles_front else '_back'
-        #
-        xy_map['id'].append(out_path)
-        xy_map['cls'].append(model_map[model_name] + class_suffix)
-        # run subprocess        
-        tp.apply_async(render_job, (model_name, obj_path, texture_path, bg_alt_path, out_path, str(angle)))
-    
-    tp.close()
-    tp.join()
+        return [cls + class_suffix for cls in sorted(set(model_map[m] for m in model_groups[model_name]))]
+    for job in result['ok']:
+        job['labels'] = labels(job['model']['name'], job['angle'])
+    render_cost.save_timings(timings_path, timings, result['ok'])
+    # only label images which were actually rendered
+    xy_map = {'id': [], 'cls': []}
+    for job in result['ok']:
+        for cls in job['labels']:
+            xy_map['id'].append(job['out'])
+            xy_map['cls'].append(cls)
+    if result['failed']:
+        pd.DataFrame({'id': [job['out'] for job, _ in result['failed']],
+                      'reason': [reason for _, reason in result['failed']]}).to_csv(dist_path + '/failed.csv')
     #
     df = pd.DataFrame(xy_map)
     df.to_csv(dist_path + '/img_map.csv')
+    frame_prune.prune(df, mask_dir).to_csv(dist_path + '/img_map_pruned.csv')
+    # one label index per target resolution
+    for res in target_res:
+        df_res = pd.DataFrame({'id': [job['res'][res] for job in result['ok'] for _ in job['labels']],
+                               'cls': [cls for job in result['ok'] for cls in job['labels']]})
+        df_res.to_csv(os.path.join(multires.res_dir(dist_path, res), 'img_map.csv'))
+    # detection data
+    if n_scenes > 0:
+        plan = scene_plan(n_scenes, models_per_scene, all_angles, ready['bgs'], ready['models'], tmp_dir, bg_tmp_dir, dist_path, render_res)
+        scene_result = render_runner.run(plan, timeout=600, retries=1, scheduler=scheduler)
+        pd.DataFrame(box_rows(scene_result['ok'], model_map, model_groups)).to_csv(dist_path + '/box_map.csv')
     # cleanup
     shutil.rmtree(tmp_dir)
     shutil.rmtree(bg_tmp_dir)
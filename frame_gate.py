@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+import cv2
+import numpy as np
+
+
+class FrameGate:
+    # Decides per region of the frame whether it changed enough since it was
+    # last classified. Unchanged regions reuse the cached prediction, regions
+    # older than max_age frames are refreshed anyway so slow changes are not
+    # missed.
+
+    def __init__(self, grid=(1, 1), thumb_cell=(16, 16), threshold=4.0, max_age=30):
+        self.grid = grid
+        self.thumb_size = (grid[1] * thumb_cell[0], grid[0] * thumb_cell[1])
+        self.threshold = threshold
+        self.max_age = max_age
+        self.reference = None
+        self.age = np.zeros(grid, dtype=np.int64)
+        self.cache = [None] * (grid[0] * grid[1])
+
+    def thumbnail(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY) if frame.ndim == 3 else frame
+        return cv2.resize(gray, self.thumb_size, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    def region_diff(self, thumb):
+        # mean absolute difference per grid cell, shape grid
+        rows, cols = self.grid
+        diff = np.abs(thumb - self.reference)
+        return diff.reshape(rows, diff.shape[0] // rows, cols, diff.shape[1] // cols).mean(axis=(1, 3))
+
+    def regions(self, frame):
+        # (y0, y1, x0, x1) of every region in row major order
+        rows, cols = self.grid
+        ys = np.linspace(0, frame.shape[0], rows + 1).astype(int)
+        xs = np.linspace(0, frame.shape[1], cols + 1).astype(int)
+        return [(ys[r], ys[r + 1], xs[c], xs[c + 1]) for r in range(rows) for c in range(cols)]
+
+    def changed(self, frame):
+        # indices of the regions which need to be classified for this frame
+        thumb = self.thumbnail(frame)
+        if self.reference is None:
+            self.reference = thumb
+            mask = np.ones(self.grid, dtype=bool)
+        else:
+            self.age += 1
+            mask = (self.region_diff(thumb) > self.threshold) | (self.age >= self.max_age)
+            # only the refreshed regions move their reference
+            cell = np.kron(mask, np.ones((thumb.shape[0] // self.grid[0], thumb.shape[1] // self.grid[1]), dtype=bool))
+            self.reference = np.where(cell, thumb, self.reference)
+        self.age[mask] = 0
+        return list(np.flatnonzero(mask))
+
+    def update(self, idx, pred):
+        self.cache[idx] = pred
+
+    def predictions(self):
+        return list(self.cache)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+import cv2
+import logging
+import numpy as np
+import os
+import pandas as pd
+import sys
+
+
+def _dct_matrix(n):
+    k = np.arange(n)
+    mat = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n)) * np.sqrt(2.0 / n)
+    mat[0, :] = np.sqrt(1.0 / n)
+    return mat
+
+
+def load_batch(paths, size=32):
+    # grayscale thumbnails, shape (n, size, size), float32
+    batch = np.zeros((len(paths), size, size), dtype=np.float32)
+    for i, path in enumerate(paths):
+        img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if img is not None:
+            batch[i] = cv2.resize(img, (size, size), interpolation=cv2.INTER_AREA)
+    return batch
+
+
+def phash(batch, hash_size=8):
+    # 64 bit perceptual hashes for a whole batch, returned as bool (n, 64)
+    dct = _dct_matrix(batch.shape[1])
+    freq = np.einsum('ij,njk,lk->nil', dct, batch, dct)[:, :hash_size, :hash_size].reshape(len(batch), -1)
+    med = np.median(freq[:, 1:], axis=1, keepdims=True)
+    return freq > med
+
+
+def hamming(hashes):
+    # pairwise hamming distance matrix
+    h = hashes.astype(np.int32)
+    return h.shape[1] - h @ h.T - (1 - h) @ (1 - h).T
+
+
+def mask_path(mask_dir, path):
+    # coverage mask rendered by blender_render next to each frame
+    return os.path.join(mask_dir, os.path.basename(path))
+
+
+def alpha_coverage(paths, threshold=128):
+    # fraction of opaque pixels in the model only RGBA masks, nan if missing
+    cov = np.full(len(paths), np.nan)
+    for i, path in enumerate(paths):
+        img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        if img is not None and img.ndim == 3 and img.shape[2] == 4:
+            cov[i] = (img[:, :, 3] >= threshold).mean()
+    return cov
+
+
+def parse_name(path):
+    # '{model}_{bg}_{angle}.png' as written by ffx_render
+    model, bg, angle = os.path.splitext(os.path.basename(path))[0].rsplit('_', 2)
+    return model, bg, angle
+
+
+def prune(df, mask_dir=None, min_coverage=0.02, max_distance=4, size=32):
+    paths = list(df['id'].unique())
+    keys = pd.DataFrame([parse_name(p) for p in paths], columns=['model', 'bg', 'angle'])
+    keys['id'] = paths
+    batch = load_batch(paths, size)
+    hashes = phash(batch)
+    index = {p: i for i, p in enumerate(paths)}
+    drop = set()
+    # near empty: the model covers almost none of the frame, frames without
+    # a mask are kept
+    if mask_dir is not None:
+        cov = alpha_coverage([mask_path(mask_dir, p) for p in paths])
+        drop.update(p for p, c in zip(paths, cov) if c < min_coverage)
+    # near duplicates: views of the same model with almost equal hashes
+    for _, grp in keys.groupby('model'):
+        ids = [p for p in grp['id'].values if p not in drop]
+        if len(ids) < 2:
+            continue
+        dist = hamming(hashes[[index[p] for p in ids]])
+        kept = []
+        for i in range(len(ids)):
+            if any(dist[i, j] <= max_distance for j in kept):
+                drop.add(ids[i])
+            else:
+                kept.append(i)
+    logging.info('Pruned frames, total={} dropped={}'.format(len(paths), len(drop)))
+    return df[~df['id'].isin(drop)]
+
+
+if __name__ == '__main__':
+    # python frame_prune.py <dist_path> [mask_dir]
+    dist_path = sys.argv[1]
+    mask_dir = sys.argv[2] if len(sys.argv) > 2 else None
+    df = pd.read_csv(os.path.join(dist_path, 'img_map.csv'), index_col=0)
+    df_pruned = prune(df, mask_dir)
+    df_pruned.to_csv(os.path.join(dist_path, 'img_map_pruned.csv'))
+    print('{} of {} rows kept'.format(len(df_pruned), len(df)))
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+# Finding the model phyre files, kept free of heavy imports so that tools
+# like probe.py can use it
+
+import logging
+import os
+
+import vbf
+
+
+def model_gather(chr_path, filter_dirs=[]):
+    model_data = []
+    sub_dirs = os.listdir(chr_path) if len(filter_dirs) == 0 else filter_dirs
+    for sub_dir in sub_dirs:
+        sub_dir_path = os.path.join(chr_path, sub_dir)
+        models = os.listdir(sub_dir_path)
+        for model in models:
+            mesh_file = os.path.join(sub_dir_path, model, 'mdl', 'd3d11', model + '.dae.phyre')
+            texture_file = os.path.join(sub_dir_path, model, 'tex', 'd3d11', model + '.dds.phyre')
+            if os.path.exists(mesh_file) and os.path.exists(texture_file):
+                model_data.append({'name': sub_dir + '_' + model, 'mesh': mesh_file,'texture': texture_file})
+            else:
+                logging.warning('Files not present: ' + mesh_file + ' or ' + texture_file)
+    return model_data
+
+
+def model_gather_vbf(vbf_path, chr_path, filter_dirs=[]):
+    # Pull only the model phyre files out of FFX_Data.vbf into chr_path (same
+    # layout as a VBFTool unpack) instead of unpacking the whole archive
+    with vbf.VbfArchive(vbf_path) as archive:
+        for name in archive.names():
+            parts = name.split('/')
+            if 'chr' not in parts or not name.endswith(('.dae.phyre', '.dds.phyre')):
+                continue
+            rel = parts[parts.index('chr') + 1:]
+            if len(filter_dirs) > 0 and rel[0] not in filter_dirs:
+                continue
+            dst = os.path.join(chr_path, *rel)
+            if not os.path.exists(dst) or os.path.getsize(dst) != archive.entries[name]['size']:
+                archive.extract(name, dst)
+    return model_gather(chr_path, filter_dirs)
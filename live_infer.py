@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+# Usage: python live_infer.py [--grid RxC] [--threshold T] [--max-age N]
+#            <model.h5|model.tflite> <img_map.csv> <frame_dir | - WxH>
+# Frames come from a directory of images or raw rgb24 frames on stdin
+# (e.g. ffmpeg -f rawvideo -pix_fmt rgb24 -), a stand-in for screen capture.
+# Each frame is split into a grid of regions (default 3x3), only regions
+# which changed by more than the threshold (mean gray level difference) or
+# were last classified max-age frames ago are sent to the classifier.
+
+import cv2
+import frame_gate
+import logging
+import numpy as np
+import os
+import pandas as pd
+import queue
+import sys
+import threading
+import time
+
+INPUT_SHAPE = (299, 299)
+GATE_OPTIONS = {'--grid': (3, 3), '--threshold': 4.0, '--max-age': 30}
+
+
+def load_labels(map_file):
+    # flow_from_dataframe numbers classes in sorted order
+    return sorted(pd.read_csv(map_file)['cls'].unique())
+
+
+def export_tflite(model_path, out_path, quantize=True):
+    # Convert a saved keras model for the TF-Lite cpu runtime, with
+    # post-training dynamic range quantization of the weights
+    import tensorflow as tf
+    converter = tf.lite.TFLiteConverter.from_keras_model(tf.keras.models.load_model(model_path))
+    if quantize:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    with open(out_path, 'wb') as fd:
+        fd.write(converter.convert())
+    return out_path
+
+
+class KerasPredictor:
+
+    def __init__(self, model_path):
+        import tensorflow as tf
+        self.model = tf.keras.models.load_model(model_path)
+
+    def __call__(self, batch):
+        return self.model.predict_on_batch(batch)
+
+
+class TFLitePredictor:
+
+    def __init__(self, model_path, threads=None):
+        import tensorflow as tf
+        self.interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=threads)
+        self.input = self.interpreter.get_input_details()[0]['index']
+        self.output = self.interpreter.get_output_details()[0]['index']
+        self.batch_size = None
+
+    def __call__(self, batch):
+        if self.batch_size != len(batch):
+            self.interpreter.resize_tensor_input(self.input, batch.shape)
+            self.interpreter.allocate_tensors()
+            self.batch_size = len(batch)
+        self.interpreter.set_tensor(self.input, batch)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output)
+
+
+def load_predictor(model_path, warmup_batches=(1, 4)):
+    # Load once and run dummy batches so graph tracing / tensor allocation
+    # does not land on the first real frames
+    if model_path.endswith('.tflite'):
+        predictor = TFLitePredictor(model_path)
+    else:
+        predictor = KerasPredictor(model_path)
+    for n in warmup_batches:
+        predictor(np.zeros((n,) + INPUT_SHAPE + (3,), dtype=np.float32))
+    return predictor
+
+
+def preprocess(frame):
+    # rgb uint8 frame -> model input, same rescale as the training generator
+    return cv2.resize(frame, INPUT_SHAPE, interpolation=cv2.INTER_AREA).astype(np.float32) / 255.
+
+
+def frames_from_dir(frame_dir, frames):
+    # stand-in capture: push (timestamp, rgb frame) for every image, then None
+    for name in sorted(os.listdir(frame_dir)):
+        img = cv2.imread(os.path.join(frame_dir, name))
+        if img is not None:
+            frames.put((time.time(), cv2.cvtColor(img, cv2.COLOR_BGR2RGB)))
+    frames.put(None)
+
+
+def frames_from_pipe(stream, width, height, frames):
+    size = width * height * 3
+    while True:
+        buf = stream.read(size)
+        if len(buf) < size:
+            break
+        frames.put((time.time(), np.frombuffer(buf, dtype=np.uint8).reshape(height, width, 3)))
+    frames.put(None)
+
+
+def micro_batches(frames, max_batch=4, budget=0.02):
+    # Collect frames until the batch is full or the oldest frame has waited
+    # `budget` seconds. Yields lists of (timestamp, frame).
+    done = False
+    while not done:
+        item = frames.get()
+        if item is None:
+            return
+        batch = [item]
+        deadline = item[0] + budget
+        while len(batch) < max_batch:
+            try:
+                item = frames.get(timeout=max(0.0, deadline - time.time()))
+            except queue.Empty:
+                break
+            if item is None:
+                done = True
+                break
+            batch.append(item)
+        yield batch
+
+
+def run(predictor, frames, labels, max_batch=4, budget=0.02, callback=None, gate=None):
+    # Classify frames from the queue, returns latency/throughput stats. With a
+    # frame_gate.FrameGate only the changed regions of a frame are sent to the
+    # classifier and the callback gets one label per region.
+    latencies = []
+    regions_total, regions_run = 0, 0
+    start = time.time()
+    for batch in micro_batches(frames, max_batch, budget):
+        crops, owners = [], []
+        for i, (_, frame) in enumerate(batch):
+            if gate is None:
+                crops.append(frame)
+                owners.append((i, None))
+                continue
+            regions = gate.regions(frame)
+            regions_total += len(regions)
+            for idx in gate.changed(frame):
+                y0, y1, x0, x1 = regions[idx]
+                crops.append(frame[y0:y1, x0:x1])
+                owners.append((i, idx))
+        regions_run += len(crops) if gate is not None else 0
+        preds = [None] * len(batch)
+        if crops:
+            y = predictor(np.stack([preprocess(crop) for crop in crops]))
+            for (i, idx), pred in zip(owners, y):
+                if gate is None:
+                    preds[i] = [pred]
+                else:
+                    gate.update(idx, pred)
+        now = time.time()
+        for i, (ts, _) in enumerate(batch):
+            latencies.append(now - ts)
+            # frames of the same batch share the latest region predictions
+            frame_preds = preds[i] if gate is None else gate.predictions()
+            if callback is not None:
+                callback([labels[int(np.argmax(p))] for p in frame_preds], frame_preds)
+    elapsed = time.time() - start
+    latencies = np.array(latencies) * 1000
+    stats = {'frames': len(latencies),
+             'fps': len(latencies) / max(elapsed, 1e-9),
+             'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+             'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else 0.0}
+    if gate is not None:
+        stats['regions_classified'] = regions_run / max(regions_total, 1)
+    logging.info('Inference stats {}'.format(stats))
+    return stats
+
+
+def parse_args(argv):
+    # gate options (see GATE_OPTIONS) first, then the positional arguments
+    options = dict(GATE_OPTIONS)
+    argv = list(argv)
+    while argv and argv[0] in options:
+        name, value = argv.pop(0), argv.pop(0)
+        if name == '--grid':
+            options[name] = tuple(int(v) for v in value.split('x'))
+        elif name == '--threshold':
+            options[name] = float(value)
+        else:
+            options[name] = int(value)
+    return options, argv
+
+
+if __name__ == '__main__':
+    options, args = parse_args(sys.argv[1:])
+    predictor = load_predictor(args[0])
+    labels = load_labels(args[1])
+    frames = queue.Queue(maxsize=64)
+    if args[2] == '-':
+        width, height = (int(v) for v in args[3].split('x'))
+        source = threading.Thread(target=frames_from_pipe, args=(sys.stdin.buffer, width, height, frames), daemon=True)
+    else:
+        source = threading.Thread(target=frames_from_dir, args=(args[2], frames), daemon=True)
+    source.start()
+    gate = frame_gate.FrameGate(grid=options['--grid'], threshold=options['--threshold'], max_age=options['--max-age'])
+    stats = run(predictor, frames, labels, callback=lambda label, pred: print(label), gate=gate)
+    print('frames={frames} fps={fps:.1f} p50={p50_ms:.1f}ms p99={p99_ms:.1f}ms'.format(**stats))
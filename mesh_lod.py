@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import numpy as np
+import os
+
+from thirdparty_xentax import phyre
+
+
+def triangle_budget(render_res, px_per_tri=8):
+    # Triangles smaller than a few pixels are not visible in the output
+    return int(render_res[0] * render_res[1] / px_per_tri)
+
+
+def read_obj(obj_path):
+    # Reads the obj files written by phyre.writeObjFile (v/vt share indices)
+    verts, uvs, groups = [], [], []
+    with open(obj_path) as fd:
+        for line in fd:
+            if line.startswith('v '):
+                verts.append([float(x) for x in line.split()[1:4]])
+            elif line.startswith('vt '):
+                uvs.append([float(x) for x in line.split()[1:3]])
+            elif line.startswith('g '):
+                groups.append((line.split()[1], []))
+            elif line.startswith('f '):
+                face = [int(tok.split('/')[0]) - 1 for tok in line.split()[1:4]]
+                groups[-1][1].append(face)
+    verts = np.array(verts, dtype=np.float64).reshape(-1, 3)
+    uvs = np.array(uvs, dtype=np.float64).reshape(-1, 2) if uvs else None
+    groups = [(name, np.array(faces, dtype=np.int64).reshape(-1, 3)) for name, faces in groups]
+    return verts, uvs, groups
+
+
+def write_obj(obj_path, verts, uvs, groups):
+    with open(obj_path, 'w') as fd:
+        fd.write('# %s\n' % os.path.basename(obj_path))
+        fd.write('# Total vertices: %d\n' % len(verts))
+        fd.write('# Total faces: %d\n' % sum(len(faces) for _, faces in groups))
+        for v in verts:
+            fd.write('v %.8e %.8e %.8e\n' % tuple(v))
+        if uvs is not None:
+            for uv in uvs:
+                fd.write('vt %.8e %.8e\n' % tuple(uv))
+        for name, faces in groups:
+            fd.write('g %s\n' % name)
+            for face in faces + 1:
+                if uvs is not None:
+                    fd.write('f %d/%d %d/%d %d/%d\n' % (face[0], face[0], face[1], face[1], face[2], face[2]))
+                else:
+                    fd.write('f %d %d %d\n' % tuple(face))
+
+
+def _cluster(verts, uvs, cells):
+    # Vertex clustering on a position grid. UVs are part of the cluster key so
+    # vertices on either side of a UV seam never get merged.
+    vmin = verts.min(axis=0)
+    extent = np.maximum(verts.max(axis=0) - vmin, 1e-12)
+    keys = [np.minimum((verts - vmin) / extent * cells, cells - 1).astype(np.int64)]
+    if uvs is not None:
+        keys.append(np.floor(uvs * cells).astype(np.int64))
+    _, labels = np.unique(np.hstack(keys), axis=0, return_inverse=True)
+    return labels.reshape(-1)
+
+
+def _collapse(verts, uvs, faces, labels):
+    n = labels.max() + 1
+    counts = np.bincount(labels, minlength=n)[:, None]
+    new_verts = np.zeros((n, 3))
+    np.add.at(new_verts, labels, verts)
+    new_verts /= counts
+    new_uvs = None
+    if uvs is not None:
+        new_uvs = np.zeros((n, 2))
+        np.add.at(new_uvs, labels, uvs)
+        new_uvs /= counts
+    new_faces = labels[faces]
+    keep = (new_faces[:, 0] != new_faces[:, 1]) & (new_faces[:, 1] != new_faces[:, 2]) & (new_faces[:, 0] != new_faces[:, 2])
+    new_faces = new_faces[keep]
+    # drop faces which collapsed onto the same triangle
+    _, first = np.unique(np.sort(new_faces, axis=1), axis=0, return_index=True)
+    new_faces = new_faces[np.sort(first)]
+    return new_verts, new_uvs, new_faces
+
+
+def decimate_set(verts, uvs, faces, budget, max_cells=1024):
+    # Returns (verts, uvs, faces) for a single face set with at most `budget` faces
+    used = np.unique(faces)
+    verts = verts[used]
+    uvs = uvs[used] if uvs is not None else None
+    remap = np.full(used.max() + 1, -1, dtype=np.int64)
+    remap[used] = np.arange(len(used))
+    faces = remap[faces]
+    if len(faces) <= budget:
+        return verts, uvs, faces
+    # binary search for the finest grid which fits the budget
+    best = None
+    lo, hi = 1, max_cells
+    while lo <= hi:
+        cells = (lo + hi) // 2
+        result = _collapse(verts, uvs, faces, _cluster(verts, uvs, cells))
+        if len(result[2]) <= budget:
+            best = result
+            lo = cells + 1
+        else:
+            hi = cells - 1
+    if best is None:
+        best = _collapse(verts, uvs, faces, _cluster(verts, uvs, 1))
+    return best
+
+
+def decimate_obj(src_obj, dst_obj, budget):
+    # Each face set gets a share of the budget proportional to its face count
+    verts, uvs, groups = read_obj(src_obj)
+    total = sum(len(faces) for _, faces in groups)
+    out_verts, out_uvs, out_groups = [], [], []
+    offset = 0
+    for name, faces in groups:
+        set_budget = max(1, int(budget * len(faces) / total))
+        v, uv, f = decimate_set(verts, uvs, faces, set_budget)
+        out_verts.append(v)
+        if uv is not None:
+            out_uvs.append(uv)
+        out_groups.append((name, f + offset))
+        offset += len(v)
+    new_uvs = np.vstack(out_uvs) if uvs is not None else None
+    write_obj(dst_obj, np.vstack(out_verts), new_uvs, out_groups)
+    logging.info('Decimated mesh, src={} faces={} dst_faces={}'.format(
+        src_obj, total, sum(len(f) for _, f in out_groups)))
+
+
+def prepare_mesh(model, cache_dir, budget):
+    # Extract and decimate a model once per triangle budget
+    out = os.path.join(cache_dir, '{}_{}.obj'.format(model['name'], budget))
+    if os.path.exists(out) and os.path.getmtime(out) >= os.path.getmtime(model['mesh']):
+        return out
+    os.makedirs(cache_dir, exist_ok=True)
+    full = os.path.join(cache_dir, model['name'] + '.obj')
+    if not os.path.exists(full) or os.path.getmtime(full) < os.path.getmtime(model['mesh']):
+        phyre.extractMesh(model['mesh'], full, debug=False)
+    tmp_out = out + '.tmp'
+    decimate_obj(full, tmp_out, budget)
+    os.replace(tmp_out, out)
+    return out
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import logging
+import numpy as np
+
+import mesh_lod
+
+
+def content_hash(paths):
+    h = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as fd:
+            for chunk in iter(lambda: fd.read(1 << 20), b''):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def geometry_signature(obj_path, bins=16):
+    # Scale invariant shape signature: sorted bounding box ratios plus a
+    # histogram of vertex distances from the centroid
+    verts, _, groups = mesh_lod.read_obj(obj_path)
+    centered = verts - verts.mean(axis=0)
+    extent = np.sort(centered.max(axis=0) - centered.min(axis=0))
+    radius = np.linalg.norm(centered, axis=1)
+    radius = radius / max(radius.max(), 1e-12)
+    hist = np.histogram(radius, bins=bins, range=(0.0, 1.0))[0].astype(np.float64)
+    return {'faces': sum(len(faces) for _, faces in groups),
+            'extent': extent / max(extent[-1], 1e-12),
+            'hist': hist / max(hist.sum(), 1.0)}
+
+
+def _rgb565(c):
+    return np.stack([(c >> 11) & 0x1f, (c >> 5) & 0x3f, c & 0x1f], axis=-1) / np.array([31.0, 63.0, 31.0])
+
+
+def texture_signature(dds_path, bins=4):
+    # Colour histogram of the texture. For DXT textures only the block end
+    # point colours are decoded which is enough for a similarity test.
+    with open(dds_path, 'rb') as fd:
+        f = fd.read()
+    height, width = np.frombuffer(f, dtype='<u4', count=2, offset=12)
+    four_cc = f[84:88]
+    data = f[128:]
+    if four_cc in (b'DXT1', b'DXT3', b'DXT5'):
+        block = 8 if four_cc == b'DXT1' else 16
+        nblocks = max(1, (int(width) + 3) // 4) * max(1, (int(height) + 3) // 4)
+        blocks = np.frombuffer(data, dtype=np.uint8, count=nblocks * block).reshape(nblocks, block)
+        colors = blocks[:, block - 8:block - 4].copy().view('<u2')
+        rgb = _rgb565(colors.astype(np.int64)).reshape(-1, 3)
+    else:
+        npx = int(width) * int(height)
+        bgra = np.frombuffer(data, dtype=np.uint8, count=npx * 4).reshape(-1, 4)
+        rgb = bgra[:, 2::-1] / 255.0
+    idx = np.minimum((rgb * bins).astype(np.int64), bins - 1)
+    hist = np.bincount(idx[:, 0] * bins * bins + idx[:, 1] * bins + idx[:, 2], minlength=bins ** 3).astype(np.float64)
+    return {'size': (int(width), int(height)), 'hist': hist / max(hist.sum(), 1.0)}
+
+
+def fingerprint(model, obj_path, dds_path):
+    return {'name': model['name'],
+            'hash': content_hash([model['mesh'], model['texture']]),
+            'geometry': geometry_signature(obj_path),
+            'texture': texture_signature(dds_path)}
+
+
+def is_similar(a, b, face_tol=0.02, geom_tol=0.05, tex_tol=0.1):
+    if a['hash'] == b['hash']:
+        return True
+    ga, gb = a['geometry'], b['geometry']
+    if abs(ga['faces'] - gb['faces']) > face_tol * max(ga['faces'], gb['faces']):
+        return False
+    if np.abs(ga['extent'] - gb['extent']).max() > geom_tol:
+        return False
+    if np.abs(ga['hist'] - gb['hist']).sum() > geom_tol:
+        return False
+    return np.abs(a['texture']['hist'] - b['texture']['hist']).sum() <= tex_tol
+
+
+class GroupIndex:
+    # Groups of similar models, built up as models arrive one by one. The
+    # first model of a group is its representative
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.representatives = []
+        self.groups = {}
+
+    def add(self, fp):
+        # representative name for the model, its own name if it is new
+        for rep in self.representatives:
+            if is_similar(rep, fp, **self.kwargs):
+                self.groups[rep['name']].append(fp['name'])
+                logging.info('Duplicate model, representative={} member={}'.format(rep['name'], fp['name']))
+                return rep['name']
+        self.representatives.append(fp)
+        self.groups[fp['name']] = [fp['name']]
+        return fp['name']
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+import cv2
+import os
+
+
+def res_dir(dist_path, res):
+    return os.path.join(dist_path, '{}x{}'.format(res[0], res[1]))
+
+
+def area_pyramid(img, sizes):
+    # Downsample to every (width, height) in sizes. Levels are halved while
+    # they are still at least four times the size, so each size is resized
+    # from a level two to four times as large (or from the input when that
+    # is already smaller), and the area filter never sees more pixels than
+    # needed.
+    levels = [img]
+    out = {}
+    for size in sorted(sizes, key=lambda s: s[0] * s[1], reverse=True):
+        while levels[-1].shape[1] >= 4 * size[0] and levels[-1].shape[0] >= 4 * size[1]:
+            prev = levels[-1]
+            levels.append(cv2.resize(prev, (prev.shape[1] // 2, prev.shape[0] // 2), interpolation=cv2.INTER_AREA))
+        src = levels[-1]
+        out[size] = src if (src.shape[1], src.shape[0]) == tuple(size) else cv2.resize(src, tuple(size), interpolation=cv2.INTER_AREA)
+    return out
+
+
+def write_resolutions(src_path, sizes, dist_path):
+    # write <dist_path>/<w>x<h>/<name> for every size, returns the paths
+    img = cv2.imread(src_path, cv2.IMREAD_UNCHANGED)
+    if img is None:
+        raise ValueError('Could not read image', src_path)
+    paths = {}
+    for size, resized in area_pyramid(img, sizes).items():
+        out_dir = res_dir(dist_path, size)
+        os.makedirs(out_dir, exist_ok=True)
+        paths[size] = os.path.join(out_dir, os.path.basename(src_path))
+        cv2.imwrite(paths[size], resized)
+    return paths
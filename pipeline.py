@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import itertools
+import logging
+import math
+from concurrent.futures import ProcessPoolExecutor
+
+import render_runner
+
+
+async def stream_jobs(queue, models, bg_files, extract, make_bg, plan, accept=None, workers=None, ready=None):
+    # Extract models and prepare backgrounds in a process pool and put render
+    # jobs on the bounded queue as soon as both a model and a background are
+    # ready, instead of waiting for all of them.
+    #   extract(model) -> model, make_bg(bg_file) -> bg name (picklable)
+    #   plan(model, bgs) -> jobs for a model on the given backgrounds
+    #   accept(model) -> False to not render a model (e.g. duplicates)
+    # ready models/bgs are appended to ready['models'] / ready['bgs']
+    # The queue is a priority queue, queued jobs with the highest job['cost']
+    # are rendered first
+    ready = {'models': [], 'bgs': []} if ready is None else ready
+    seq = itertools.count()
+    loop = asyncio.get_running_loop()
+    try:
+        with ProcessPoolExecutor(workers) as pool:
+            # backgrounds first, every model needs them
+            tasks = {loop.run_in_executor(pool, make_bg, f): 'bg' for f in bg_files}
+            tasks.update({loop.run_in_executor(pool, extract, m): 'model' for m in models})
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for fut in done:
+                    try:
+                        value = fut.result()
+                    except Exception as e:
+                        logging.warning('Pipeline stage failed, stage={} error={}'.format(tasks[fut], repr(e)))
+                        continue
+                    if tasks[fut] == 'bg':
+                        ready['bgs'].append(value)
+                        new = [(m, [value]) for m in ready['models']]
+                    elif accept is None or accept(value):
+                        ready['models'].append(value)
+                        new = [(value, list(ready['bgs']))]
+                    else:
+                        continue
+                    for model, bgs in new:
+                        if not bgs:
+                            continue
+                        for job in plan(model, bgs):
+                            await queue.put((-job.get('cost', 0.0), next(seq), job))
+    finally:
+        # sorts after every job
+        await queue.put((math.inf, next(seq), None))
+    return ready
+
+
+async def _run(models, bg_files, extract, make_bg, plan, accept, workers, queue_size, ready, runner_kwargs):
+    queue = asyncio.PriorityQueue(maxsize=queue_size)
+    producer = asyncio.create_task(stream_jobs(queue, models, bg_files, extract, make_bg, plan, accept, workers, ready))
+    result = await render_runner.run_jobs(queue, **runner_kwargs)
+    await producer
+    return result
+
+
+def run(models, bg_files, extract, make_bg, plan, accept=None, workers=None, queue_size=64, ready=None, **runner_kwargs):
+    # returns the render_runner result, models are processed in the given order
+    return asyncio.run(_run(models, bg_files, extract, make_bg, plan, accept, workers, queue_size, ready, runner_kwargs))
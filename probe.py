@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+# Usage: python probe.py <chr_path> [sub_dir ...] > stats.jsonl
+# Prints one json line of mesh/texture header stats per model
+
+import contextlib
+import json
+import logging
+import sys
+
+from gather import model_gather
+from thirdparty_xentax import phyre
+
+
+def probe_model(model):
+    stats = {'name': model['name']}
+    try:
+        # phyre prints its warnings, keep them off the json output
+        with contextlib.redirect_stdout(sys.stderr):
+            mesh = phyre.probeMesh(model['mesh'])
+            stats.update({'sets': mesh['sets'], 'faces': mesh['faces'], 'verts': mesh['verts']})
+            stats.update(phyre.probeDDS(model['texture']))
+    except Exception as e:
+        logging.warning('Probe failed, model={} error={}'.format(model['name'], repr(e)))
+        stats['error'] = repr(e)
+    return stats
+
+
+if __name__ == '__main__':
+    for model in model_gather(sys.argv[1], sys.argv[2:]):
+        print(json.dumps(probe_model(model)))
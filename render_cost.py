@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+import json
+import logging
+import numpy as np
+import os
+
+from thirdparty_xentax import phyre
+
+# seconds, used until there are enough past timings to fit the model
+DEFAULT_COST = {'base': 6.0, 'per_face': 2e-4, 'per_texel': 1e-6}
+
+
+def probe_stats(model):
+    # face/vertex counts and texel count from the source phyre headers,
+    # available before extraction
+    try:
+        mesh = phyre.probeMesh(model['mesh'])
+        tex = phyre.probeDDS(model['texture'])
+    except Exception as e:
+        logging.warning('Probe failed, model={} error={}'.format(model['name'], repr(e)))
+        return {'faces': 0, 'verts': 0, 'texels': 0}
+    return {'faces': mesh['faces'], 'verts': mesh['verts'], 'texels': tex['width'] * tex['height']}
+
+
+def load_timings(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as fd:
+        return json.load(fd)
+
+
+def save_timings(path, timings, jobs):
+    # running mean of render seconds per model
+    for job in jobs:
+        name = job['model']['name']
+        count, mean = timings.get(name, (0, 0.0))
+        timings[name] = (count + 1, mean + (job['seconds'] - mean) / (count + 1))
+    with open(path, 'w') as fd:
+        json.dump(timings, fd, indent=1)
+
+
+def fit_cost(stats, timings):
+    # least squares fit of seconds = base + per_face*faces + per_texel*texels
+    names = [n for n in timings if n in stats]
+    if len(names) < 3:
+        return dict(DEFAULT_COST)
+    x = np.array([[1.0, stats[n]['faces'], stats[n]['texels']] for n in names])
+    y = np.array([timings[n][1] for n in names])
+    coef = np.linalg.lstsq(x, y, rcond=None)[0]
+    if (coef < 0).any():
+        return dict(DEFAULT_COST)
+    return {'base': coef[0], 'per_face': coef[1], 'per_texel': coef[2]}
+
+
+def job_cost(name, stats, timings, cost):
+    # measured mean for known models, fitted estimate otherwise
+    if name in timings:
+        return timings[name][1]
+    s = stats[name]
+    return cost['base'] + cost['per_face'] * s['faces'] + cost['per_texel'] * s['texels']
+
+
+def longest_first(jobs, stats, timings, workers):
+    # Sort jobs by decreasing estimated cost and simulate greedy packing onto
+    # `workers` slots to estimate the total wall time
+    cost = fit_cost(stats, timings)
+    for job in jobs:
+        job['cost'] = job_cost(job['model']['name'], stats, timings, cost)
+    jobs = sorted(jobs, key=lambda j: j['cost'], reverse=True)
+    slots = [0.0] * max(1, workers)
+    for job in jobs:
+        heapq.heappush(slots, heapq.heappop(slots) + job['cost'])
+    total = sum(j['cost'] for j in jobs)
+    logging.info('Render plan, jobs={} cpu_time={:.0f}s est_wall_time={:.0f}s workers={}'.format(
+        len(jobs), total, max(slots), workers))
+    return jobs, max(slots)
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import numpy as np
+import os
+import subprocess
+import time
+
+TEMPLATE = 'render_template.blend'
+# the template already holds the static scene state, --factory-startup skips
+# loading the user startup file and preferences
+BLENDER_CMD = ['blender', '--background', '--factory-startup', TEMPLATE, '--python', 'blender_render.py']
+LEGACY_CMD = ['blender', '--background', '--python', 'blender_render.py']
+
+
+def build_template(path=TEMPLATE, force=False):
+    if os.path.exists(path) and not force:
+        return path
+    subprocess.check_output(['blender', '--background', '--factory-startup', '--python', 'blender_render.py',
+                             '--', '--template', os.path.abspath(path)], stderr=subprocess.STDOUT)
+    logging.info('Built blender template, path=' + path)
+    return path
+
+
+def bench_startup(runs=5):
+    # mean seconds from launch to a ready scene with images-as-planes loaded,
+    # for the default startup and for the template
+    expr = 'import addon_utils; addon_utils.enable("io_import_images_as_planes")'
+    cmds = {'default': LEGACY_CMD[:2] + ['--python-expr', expr],
+            'template': BLENDER_CMD[:4] + ['--python-expr', expr]}
+    result = {}
+    for name, cmd in cmds.items():
+        start = time.time()
+        for _ in range(runs):
+            subprocess.check_output(cmd, stderr=subprocess.STDOUT)
+        result[name] = (time.time() - start) / runs
+    return result
+
+
+class CoreScheduler:
+    # Splits the host cpus between concurrent Blender workers. Each worker gets
+    # an explicit render thread count and cpu affinity, and the number of
+    # workers is hill climbed on the measured images per second.
+
+    def __init__(self, cpus=None, start=None, min_workers=1, max_workers=None, window=24):
+        self.cpus = sorted(os.sched_getaffinity(0)) if cpus is None else list(cpus)
+        self.min_workers = min_workers
+        self.max_workers = min(max_workers or len(self.cpus), len(self.cpus))
+        self.target = min(max(start or len(self.cpus) // 2, min_workers), self.max_workers)
+        self.window = window
+        self.direction = 1
+        self.last_rate = None
+        self.done = 0
+        self.window_start = time.time()
+
+    def slot_cpus(self, slot):
+        # contiguous block of cpus for worker `slot`, the cpus are split into
+        # `target` blocks whose sizes differ by at most one
+        if self.target >= len(self.cpus):
+            return [self.cpus[slot % len(self.cpus)]]
+        return [int(c) for c in np.array_split(self.cpus, self.target)[slot % self.target]]
+
+    def job_cmd(self, cmd, slot):
+        # --threads must come before --python, blender handles args in order
+        return cmd[:1] + ['--threads', str(len(self.slot_cpus(slot)))] + cmd[1:]
+
+    def record(self):
+        self.done += 1
+        if self.done < self.window:
+            return
+        rate = self.done / max(time.time() - self.window_start, 1e-6)
+        if self.last_rate is not None and rate < self.last_rate:
+            self.direction = -self.direction
+        self.last_rate = rate
+        target = min(max(self.target + self.direction, self.min_workers), self.max_workers)
+        if target == self.target:
+            self.direction = -self.direction
+        logging.info('Scheduler rate={:.3f} img/s workers={} -> {}'.format(rate, self.target, target))
+        self.target = target
+        self.done = 0
+        self.window_start = time.time()
+
+
+def _set_affinity(cpus):
+    def preexec():
+        os.sched_setaffinity(0, cpus)
+    return preexec
+
+
+async def run_job(job, timeout=600, retries=1, cmd=BLENDER_CMD, cpus=None):
+    # Returns None on success, else the reason of the last failed attempt
+    instr = '\n'.join(job['args']).encode()
+    reason = None
+    # a stale image from an earlier run must not count as success
+    if os.path.exists(job['out']):
+        os.remove(job['out'])
+    for attempt in range(retries + 1):
+        try:
+            proc = await asyncio.create_subprocess_exec(*cmd, stdin=asyncio.subprocess.PIPE,
+                                                        stdout=asyncio.subprocess.PIPE,
+                                                        stderr=asyncio.subprocess.STDOUT,
+                                                        preexec_fn=_set_affinity(cpus) if cpus else None)
+        except (OSError, subprocess.SubprocessError) as e:
+            # e.g. blender missing, or cpus not available to set the affinity
+            reason = 'start failed: ' + repr(e)
+            logging.warning('Render failed, out={} attempt={} reason={}'.format(job['out'], attempt, reason))
+            continue
+        try:
+            out, _ = await asyncio.wait_for(proc.communicate(instr), timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            reason = 'timeout after {}s'.format(timeout)
+            logging.warning('Render timed out, out={} attempt={}'.format(job['out'], attempt))
+            continue
+        logging.info('Blender out=' + str(out))
+        if proc.returncode != 0:
+            reason = 'exit code {}'.format(proc.returncode)
+        elif not os.path.exists(job['out']):
+            reason = 'no output image'
+        else:
+            return None
+        logging.warning('Render failed, out={} attempt={} reason={}'.format(job['out'], attempt, reason))
+    return reason
+
+
+async def run_jobs(jobs, concurrency=12, timeout=600, retries=1, cmd=BLENDER_CMD, scheduler=None, post=None):
+    # Jobs are pulled lazily from the (possibly generator) plan by a fixed
+    # number of workers, so at most `concurrency` renders are in flight. With
+    # a scheduler, worker slots above scheduler.target sit idle. `post(job)`
+    # runs in a thread for every rendered image, an exception fails the job.
+    # `jobs` can also be an asyncio.Queue fed by a producer, ended with None,
+    # or an asyncio.PriorityQueue of (priority, seq, job) tuples.
+    loop = asyncio.get_running_loop()
+    result = {'ok': [], 'failed': [], 'first_image': None}
+    start = time.time()
+    exhausted = False
+    if isinstance(jobs, asyncio.Queue):
+        async def next_job():
+            item = await jobs.get()
+            job = item[-1] if isinstance(jobs, asyncio.PriorityQueue) else item
+            if job is None:
+                # leave the end marker for the other workers
+                await jobs.put(item)
+            return job
+    else:
+        job_iter = iter(jobs)
+
+        async def next_job():
+            return next(job_iter, None)
+
+    async def worker(slot):
+        nonlocal exhausted
+        while not exhausted:
+            if scheduler is not None and slot >= scheduler.target:
+                await asyncio.sleep(0.5)
+                continue
+            job = await next_job()
+            if job is None:
+                exhausted = True
+                break
+            job_start = time.time()
+            if scheduler is None:
+                reason = await run_job(job, timeout, retries, cmd)
+            else:
+                reason = await run_job(job, timeout, retries, scheduler.job_cmd(cmd, slot), scheduler.slot_cpus(slot))
+                scheduler.record()
+            if reason is None and post is not None:
+                try:
+                    await loop.run_in_executor(None, post, job)
+                except Exception as e:
+                    reason = 'post processing: ' + repr(e)
+            job['seconds'] = time.time() - job_start
+            if reason is None:
+                if result['first_image'] is None:
+                    result['first_image'] = time.time() - start
+                    logging.info('First image after {:.1f}s'.format(result['first_image']))
+                result['ok'].append(job)
+            else:
+                result['failed'].append((job, reason))
+
+    workers = concurrency if scheduler is None else scheduler.max_workers
+    await asyncio.gather(*(worker(slot) for slot in range(workers)))
+    logging.info('Rendered {} images, {} failed, in {:.1f}s'.format(
+        len(result['ok']), len(result['failed']), time.time() - start))
+    return result
+
+
+def run(jobs, **kwargs):
+    return asyncio.run(run_jobs(jobs, **kwargs))
+
+
+if __name__ == '__main__':
+    build_template()
+    for name, seconds in bench_startup().items():
+        print('{:10s} {:.3f}s per blender launch'.format(name, seconds))
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+import augment
+
+NO_JITTER = dict(rotation_range=0, width_shift_range=0, height_shift_range=0, horizontal_flip=False,
+                 brightness=0, contrast=0, saturation=0)
+
+
+def batch(n=4, size=16):
+    return np.random.default_rng(0).integers(0, 256, (n, size, size, 3)).astype(np.uint8)
+
+
+def test_no_jitter_is_identity():
+    x = batch()
+    np.testing.assert_array_equal(augment.augment_batch(x, 0, **NO_JITTER), x)
+
+
+def test_colour_rounds():
+    # brightness of +0.6 rounds up, not down
+    x = batch()
+    params = augment.random_params(np.random.default_rng(0), len(x), **NO_JITTER)
+    params['brightness'] = np.full(len(x), 0.6)
+    np.testing.assert_array_equal(augment.colour_batch(x, params), np.minimum(x.astype(int) + 1, 255))
+
+
+def test_seeded():
+    x = batch()
+    np.testing.assert_array_equal(augment.augment_batch(x, (3, 1)), augment.augment_batch(x, (3, 1)))
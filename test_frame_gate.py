@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+import frame_gate
+
+
+def frame(value=100):
+    # 96x96 rgb frame, regions of 32x32 on a 3x3 grid
+    return np.full((96, 96, 3), value, dtype=np.uint8)
+
+
+def test_first_frame_classifies_all():
+    gate = frame_gate.FrameGate(grid=(3, 3))
+    assert gate.changed(frame()) == list(range(9))
+    assert gate.changed(frame()) == []
+
+
+def test_one_changed_region():
+    gate = frame_gate.FrameGate(grid=(3, 3), threshold=4.0)
+    gate.changed(frame())
+    img = frame()
+    # middle row, right column
+    img[32:64, 64:96] = 200
+    assert gate.changed(img) == [5]
+    assert gate.regions(img)[5] == (32, 64, 64, 96)
+    # the changed region is the new reference
+    assert gate.changed(img) == []
+
+
+def test_small_change_below_threshold():
+    gate = frame_gate.FrameGate(grid=(3, 3), threshold=4.0)
+    gate.changed(frame())
+    assert gate.changed(frame(102)) == []
+
+
+def test_max_age_refreshes_stale_regions():
+    gate = frame_gate.FrameGate(grid=(2, 2), max_age=3)
+    gate.changed(frame())
+    assert gate.changed(frame()) == []
+    assert gate.changed(frame()) == []
+    # third frame after the last classification
+    assert gate.changed(frame()) == [0, 1, 2, 3]
+    img = frame()
+    img[:48, :48] = 0
+    assert gate.changed(img) == [0]
+    assert gate.changed(img) == []
+    # region 0 was refreshed one frame later than the others
+    assert gate.changed(img) == [1, 2, 3]
+    assert gate.changed(img) == [0]
+
+
+def test_cached_predictions():
+    gate = frame_gate.FrameGate(grid=(1, 2))
+    gate.changed(frame())
+    gate.update(0, 'left')
+    gate.update(1, 'right')
+    assert gate.predictions() == ['left', 'right']
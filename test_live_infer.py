@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import queue
+import threading
+import time
+
+import numpy as np
+
+import live_infer
+
+
+def frame_queue(n, shape=(64, 64, 3)):
+    frames = queue.Queue()
+    for i in range(n):
+        frames.put((time.time(), np.full(shape, i, dtype=np.uint8)))
+    frames.put(None)
+    return frames
+
+
+class StubPredictor:
+    # one hot on class (number of calls % classes), records the batch sizes
+
+    def __init__(self, classes=3):
+        self.classes = classes
+        self.sizes = []
+
+    def __call__(self, batch):
+        assert batch.shape[1:] == live_infer.INPUT_SHAPE + (3,)
+        self.sizes.append(len(batch))
+        return np.eye(self.classes, dtype=np.float32)[[len(self.sizes) % self.classes] * len(batch)]
+
+
+def test_micro_batches_full():
+    # frames already waiting are batched up to max_batch, the rest at the end
+    batches = list(live_infer.micro_batches(frame_queue(10), max_batch=4, budget=1.0))
+    assert [len(b) for b in batches] == [4, 4, 2]
+    assert [int(f[0, 0, 0]) for b in batches for _, f in b] == list(range(10))
+
+
+def test_micro_batches_budget():
+    # frames arriving slower than the budget are not held back for a batch
+    frames = queue.Queue()
+
+    def produce():
+        for i in range(4):
+            frames.put((time.time(), np.zeros((8, 8, 3), dtype=np.uint8)))
+            time.sleep(0.1)
+        frames.put(None)
+
+    threading.Thread(target=produce, daemon=True).start()
+    start = time.time()
+    batches = list(live_infer.micro_batches(frames, max_batch=4, budget=0.01))
+    assert [len(b) for b in batches] == [1, 1, 1, 1]
+    assert time.time() - start < 1.0
+
+
+def test_micro_batches_end_of_stream():
+    assert list(live_infer.micro_batches(frame_queue(0))) == []
+
+
+def test_run_stats():
+    predictor = StubPredictor()
+    seen = []
+    stats = live_infer.run(predictor, frame_queue(10), ['a', 'b', 'c'], max_batch=4, budget=1.0,
+                           callback=lambda labels, preds: seen.append(labels))
+    assert predictor.sizes == [4, 4, 2]
+    assert seen == [['b']] * 4 + [['c']] * 4 + [['a']] * 2
+    assert set(stats) == {'frames', 'fps', 'p50_ms', 'p99_ms'}
+    assert stats['frames'] == 10 and stats['fps'] > 0
+    assert 0 <= stats['p50_ms'] <= stats['p99_ms']
+
+
+def test_run_empty():
+    stats = live_infer.run(StubPredictor(), frame_queue(0), ['a'])
+    assert stats['frames'] == 0 and stats['p50_ms'] == 0.0
+
+
+def test_parse_args():
+    options, args = live_infer.parse_args(['--grid', '2x4', '--max-age', '10', 'model.tflite', 'map.csv', '-', '640x480'])
+    assert options == {'--grid': (2, 4), '--threshold': 4.0, '--max-age': 10}
+    assert args == ['model.tflite', 'map.csv', '-', '640x480']
+    assert live_infer.parse_args(['m.h5', 'map.csv', 'frames'])[0]['--grid'] == (3, 3)
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import render_runner
+
+
+def jobs(tmp_path, n=3):
+    return [{'args': ['name'], 'out': str(tmp_path / '{}.png'.format(i))} for i in range(n)]
+
+
+def test_missing_binary_fails_jobs(tmp_path):
+    result = render_runner.run(jobs(tmp_path), cmd=[str(tmp_path / 'missing')], retries=1, concurrency=2)
+    assert result['ok'] == []
+    assert len(result['failed']) == 3
+    assert all(reason.startswith('start failed') for _, reason in result['failed'])
+
+
+def test_unavailable_cpus_fail_jobs(tmp_path):
+    # affinity to a cpu this host does not have fails in preexec_fn
+    missing = max(os.sched_getaffinity(0)) + 1
+    scheduler = render_runner.CoreScheduler(cpus=[missing], min_workers=1, max_workers=1)
+    result = render_runner.run(jobs(tmp_path), cmd=['true'], retries=0, scheduler=scheduler)
+    assert [reason.startswith('start failed') for _, reason in result['failed']] == [True] * 3
+
+
+def test_no_output_image(tmp_path):
+    result = render_runner.run(jobs(tmp_path, 1), cmd=['true'], retries=0)
+    assert [reason for _, reason in result['failed']] == ['no output image']
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+import random
+import struct
+import zlib
+
+import pytest
+
+import vbf
+from thirdparty_xentax import phyre
+
+
+def dds_phyre(width=256, height=256, mips=9, encoding=b'DXT5', size=1000):
+    # just enough of a .dds.phyre for getHeaderData/findEncoding
+    data = b'xx' * 10 + b'PS3Data' + b'\0' * 41 + struct.pack('I', mips) + b'\0' * 12 + \
+           struct.pack('2I', width, height) + encoding
+    return data + bytes(random.Random(1).getrandbits(8) for _ in range(size - len(data)))
+
+
+def write_vbf(path, files):
+    # files: list of (name, data, compress), blocks of each file are zlib
+    # compressed when `compress` is set and stored raw otherwise
+    names = b''
+    name_offsets = []
+    for name, _, _ in files:
+        name_offsets.append(len(names))
+        names += name.encode() + b'\0'
+    blocks = []
+    chunks = []
+    table = []
+    for (name, data, compress), name_offset in zip(files, name_offsets):
+        first = len(blocks)
+        stored = b''
+        for pos in range(0, max(1, len(data)), vbf.BLOCK_SIZE):
+            block = data[pos:pos + vbf.BLOCK_SIZE]
+            if compress:
+                block = zlib.compress(block)
+            blocks.append(0 if len(block) == vbf.BLOCK_SIZE else len(block))
+            stored += block
+        chunks.append(stored)
+        table.append((first, 0, len(data), name_offset))
+    header_len = 16 + 48 * len(files) + 4 + len(names) + 2 * len(blocks)
+    out = struct.pack('<IIQ', vbf.VBF_MAGIC, header_len, len(files)) + b'\0' * 16 * len(files)
+    offset = header_len
+    for (first, unknown, size, name_offset), stored in zip(table, chunks):
+        out += struct.pack('<IIQQQ', first, unknown, size, offset, name_offset)
+        offset += len(stored)
+    out += struct.pack('<I', 4 + len(names)) + names
+    out += struct.pack('<%dH' % len(blocks), *blocks)
+    with open(path, 'wb') as fd:
+        fd.write(out + b''.join(chunks))
+
+
+@pytest.fixture
+def archive(tmp_path):
+    rng = random.Random(0)
+    files = [('ffx_data/gamedata/ps3data/chr/mon/m001/tex/d3d11/m001.dds.phyre', dds_phyre(), False),
+             ('ffx_data/gamedata/ps3data/chr/mon/m001/mdl/d3d11/m001.dae.phyre', b'mesh data ' * 15000, True),
+             ('ffx_data/gamedata/ps3data/snd/full.bin', bytes(rng.getrandbits(8) for _ in range(vbf.BLOCK_SIZE)), False)]
+    path = str(tmp_path / 'test.vbf')
+    write_vbf(path, files)
+    with vbf.VbfArchive(path) as archive:
+        yield archive, {name: data for name, data, _ in files}
+
+
+def test_index(archive):
+    archive, files = archive
+    assert sorted(archive.names()) == sorted(files)
+    assert archive.names('ffx_data/gamedata/ps3data/chr/') == [n for n in files if '/chr/' in n]
+    assert archive.find('m001.dae.phyre') == 'ffx_data/gamedata/ps3data/chr/mon/m001/mdl/d3d11/m001.dae.phyre'
+    with pytest.raises(KeyError):
+        archive.find('.phyre')
+    # the zlib entry spans three blocks, the last one partial
+    entry = archive.entries[archive.find('m001.dae.phyre')]
+    assert entry['blocks'] == 3
+    assert [o for _, o in archive._block_sizes(entry)] == [vbf.BLOCK_SIZE, vbf.BLOCK_SIZE, 150000 - 2 * vbf.BLOCK_SIZE]
+
+
+def test_view(archive):
+    archive, files = archive
+    for name, data in files.items():
+        assert bytes(archive.view(name)) == data
+    # raw entries, including a full block with stored size 0, are not copied
+    assert archive.is_stored(archive.find('m001.dds.phyre'))
+    assert archive.is_stored(archive.find('full.bin'))
+    assert not archive.is_stored(archive.find('m001.dae.phyre'))
+    assert archive.view(archive.find('full.bin')).obj is archive._mm
+
+
+def test_extract(archive, tmp_path):
+    archive, files = archive
+    for name, data in files.items():
+        dst = archive.extract(name, str(tmp_path / 'out' / name))
+        with open(dst, 'rb') as fd:
+            assert fd.read() == data
+
+
+def test_phyre_on_view(archive):
+    archive, _ = archive
+    view = archive.view(archive.find('m001.dds.phyre'))
+    assert phyre.readPhyre(view) is view
+    assert phyre.getHeaderData(view) == (256, 256, 9)
+    info = phyre.probeDDS(view)
+    assert (info['encode'], info['width'], info['mips']) == ('DXT5', 256, 9)
+
+
+def test_probe_mesh_on_view():
+    # two face header blocks of 100 and 50 faces behind some padding and an
+    # invalid block (0 faces) which findFaceHeader has to skip
+    blocks = b''
+    for n_face, n_vert in ((100, 80), (50, 40)):
+        block = [0] * 27
+        block[0] = 0xffffffff
+        block[12] = n_vert - 1
+        block[13] = n_face * 3
+        block[24] = n_face * 2 * 3
+        blocks += struct.pack('27I', *block)
+    data = b'\0' * 64 + struct.pack('27I', 0xffffffff, *[0] * 26) + blocks + b'\0' * 64
+    assert phyre.findFaceHeader(memoryview(data)) == 64 + 27 * 4
+    info = phyre.probeMesh(memoryview(data))
+    assert (info['sets'], info['faces'], info['verts']) == (2, 150, 120)
+
+
+def test_close_with_view(tmp_path):
+    path = str(tmp_path / 'test.vbf')
+    write_vbf(path, [('a/b.bin', b'abc' * 10, False)])
+    archive = vbf.VbfArchive(path)
+    view = archive.view('a/b.bin')
+    archive.close()
+    assert bytes(view) == b'abc' * 10
+    view.release()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+import mesh_lod
+import viewpoints
+
+
+def box(size, n=8):
+    # closed box mesh centred on the origin, every side an n x n grid of
+    # outward facing quads (silhouettes are binned from face centroids)
+    size = np.asarray(size, dtype=np.float64)
+    t = np.linspace(-0.5, 0.5, n + 1)
+    u, v = [a.ravel() for a in np.meshgrid(t, t, indexing='ij')]
+    verts, faces = [], []
+    for axis in range(3):
+        for sign in (-1, 1):
+            side = np.zeros((len(u), 3))
+            side[:, axis] = sign * 0.5
+            side[:, (axis + 1) % 3] = u
+            side[:, (axis + 2) % 3] = v
+            base = len(verts) * len(u)
+            quads = [(i * (n + 1) + j, (i + 1) * (n + 1) + j, (i + 1) * (n + 1) + j + 1, i * (n + 1) + j + 1)
+                     for i in range(n) for j in range(n)]
+            tris = np.array([(a, b, c) for a, b, c, d in quads] + [(a, c, d) for a, b, c, d in quads]) + base
+            if sign < 0:
+                tris = tris[:, ::-1]
+            verts.append(side * size)
+            faces.append(tris)
+    return np.vstack(verts), np.vstack(faces)
+
+
+def test_to_blender():
+    # obj up (y) is blender up (z), obj forward (-z) is blender +y
+    verts = viewpoints.to_blender(np.array([[1.0, 2.0, 3.0]]))
+    assert verts.tolist() == [[1.0, -3.0, 2.0]]
+
+
+def test_flat_model_in_obj_file(tmp_path):
+    # a board standing upright in the obj x-y plane, thin along obj z. In
+    # blender it faces +-y, i.e. the cameras at 0 and 180 degrees
+    verts, faces = box((10.0, 10.0, 0.5))
+    obj_path = str(tmp_path / 'board.obj')
+    mesh_lod.write_obj(obj_path, verts, None, [('board', faces)])
+    angles = list(range(0, 360, 45))
+    assert sorted(viewpoints.select_for_obj(obj_path, angles, k=2, max_iou=1.0)) == [0, 180]
+
+
+def test_flat_model_blender_space():
+    # thin along blender x: the cameras at 90 and 270 degrees see it face on
+    verts, faces = box((0.5, 10.0, 10.0))
+    angles = list(range(0, 360, 45))
+    assert sorted(viewpoints.select(verts, faces, angles, k=2, max_iou=1.0)) == [90, 270]
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import math
+import os
+
+import bg_convert
+import mesh_lod
+from thirdparty_xentax import phyre
+
+
+def model_extent(obj_path):
+    # largest bounding box side of an extracted model, in scene units
+    verts = mesh_lod.read_obj(obj_path)[0]
+    return float((verts.max(axis=0) - verts.min(axis=0)).max()) if len(verts) else 0.0
+
+
+def screen_size(extent, render_res, fov=bg_convert.BLENDER_DEFAULT_FOV):
+    # Output pixels spanned by a model `extent` units across. The camera
+    # distance is the one of blender_render.run, 30 + 10 * extent / 14.5,
+    # measured to the model's nearest faces
+    dist = max(30.0 + 10.0 * extent / 14.5 - extent / 2, 1e-6)
+    return max(render_res) * extent / (2 * dist * math.tan(math.radians(fov) / 2))
+
+
+def texture_level(width, height, mips, render_res, oversample=1.0, extent=None, wrap=2.0):
+    # Smallest mip level which still gives `oversample` texels per output
+    # pixel. The texture is wrapped around the model, so about `wrap` times
+    # its on-screen size in texels cover it. Without an extent the model is
+    # assumed to fill the whole frame
+    px = max(render_res) if extent is None else screen_size(extent, render_res)
+    needed = px * wrap * oversample
+    level = 0
+    while level + 1 < mips and max(width >> (level + 1), height >> (level + 1)) >= needed:
+        level += 1
+    return level
+
+
+def prepare_texture(model, cache_dir, render_res, oversample=1.0, extent=None):
+    # Extract the reduced texture for a model once per output resolution and
+    # oversampling
+    out = os.path.join(cache_dir, '{}_{}x{}_x{:g}.dds'.format(model['name'], render_res[0], render_res[1], oversample))
+    if os.path.exists(out) and os.path.getmtime(out) >= os.path.getmtime(model['texture']):
+        return out
+    info = phyre.probeDDS(model['texture'])
+    level = texture_level(info['width'], info['height'], info['mips'], render_res, oversample, extent)
+    logging.info('Texture lod, model={} size={}x{} mips={} level={}'.format(
+        model['name'], info['width'], info['height'], info['mips'], level))
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_out = out + '.tmp'
+    phyre.extractDDS(model['texture'], tmp_out, mipSkip=level)
+    os.replace(tmp_out, out)
+    return out
@@ -10,6 +10,14 @@
 # extractDDS(inputFile, objFile[, keywordArg1...])
 #   Extract DDS file from a .dds.phyre file and convert to .dds format.
 #   See ddsArgs0 below for optional keyword arguments. 
+#
+# probeMesh(inputFile) / probeDDS(inputFile)
+#   Read only the header blocks and return a dict of counts/sizes without
+#   extracting anything. Files are memory mapped so only the touched pages
+#   are read.
+#
+# Instead of a file name, inputFile/phyreFile can also be the file contents
+# as a bytes-like object (e.g. a view into a vbf archive).
 
 
 #------------------------------------------------------------------------------
@@ -19,7 +27,9 @@
 #------------------------------------------------------------------------------
 #------------------------------------------------------------------------------
 
+import mmap
 import os
+import re
 import struct
 
 # global variable names with default values
@@ -42,7 +52,8 @@ ddsArgs0={'ddsStartAddr': None, # Start address for DDS data (None=find automati
          'width': None, # Forced width resolution (None=find automatically)
          'height': None, # Forced height resolution (None=find automatically)
          'encode': None, # DXT1/DXT3/DXT5/ARGB8, (None=find automatically)
-         'mipMaps': None  # Number of mip maps in file (None=find automatically)
+         'mipMaps': None,  # Number of mip maps in file (None=find automatically)
+         'mipSkip': 0  # Number of leading (largest) mip levels to drop
         }
 
         
@@ -62,6 +73,25 @@ encode0={'DXT5':  {'bbp':  8, 'minDim': 4}, \
 #------------------------------------------------------------------------------
 #------------------------------------------------------------------------------
 # Generic functions
+def readPhyre(inputFile):
+    # File contents from a file name, bytes-like objects are used as is
+    
+    if not isinstance(inputFile, str):
+        return inputFile
+    with open(inputFile, 'rb') as file:
+        return file.read()
+
+#------------------------------------------------------------------------------
+def findBytes(f, sub, start=0):
+    # f.find(sub, start) which also works on memoryviews (no copy, re
+    # searches any buffer)
+    
+    if hasattr(f, 'find'):
+        return f.find(sub, start)
+    match = re.compile(re.escape(sub)).search(f, start)
+    return match.start() if match else -1
+
+#------------------------------------------------------------------------------
 def parseKeywords(options0, kwargs):
     # Parse provided keyword arguments, and fill in defaults to dict
     
@@ -82,9 +112,9 @@ def extractMesh(inputFile, objFile=None, **kwargs):
     
     print("EXTRACTMESH")
     
-    print("Reading phyre file %s..." % inputFile)
-    with open(inputFile,'rb') as file:
-        f = file.read()
+    if isinstance(inputFile, str):
+        print("Reading phyre file %s..." % inputFile)
+    f = readPhyre(inputFile)
     
     print("Extracting faces...")
     faceSet = extractFaceSets(f)
@@ -152,30 +182,8 @@ def extractFaceSets(f):
     faceSet = []
 
     print("  Finding start of face header blocks...")
-    match = meshArgs['faceHeaderAddr']
-    faceHeaderCatch=b'\xff\xff\xff\xff'
-    match = f.find(faceHeaderCatch, match+1) 
-    while match > 0:
-        block = struct.unpack_from('27I', f, match)
-        nFace = block[13]/3
-        nVert = block[12]+1
-        
-        valid = True
-        if nFace % 1 > 0: valid = False 
-        if nFace <= 0: valid = False
-        if nFace > 0xffff: valid = False # needs to fit in uint16
-        if nVert < 3: valid = False  # always at least 3 vertices
-        if nVert >= 0xffff: valid = False # needs to fit in uint16
-        if block[22] != 0: valid = False # face block offset (0 for first block)
-        if block[24] != nFace*2*3: valid = False # number of bytes in face block
-        
-        if valid:
-            break
-        else:
-            match = f.find(faceHeaderCatch, match+1)
-            
-    pos = match
-    if match < 0:
+    pos = findFaceHeader(f, meshArgs['faceHeaderAddr'])
+    if pos is None:
         print("    FAIL: Couldn't find face header block")
         return None
     if meshArgs['debug']: print("    Start of face header blocks: " + hex(pos))
@@ -240,7 +248,7 @@ def extractFaceSets(f):
 def findFaceStartAddr(f, nFace, nVert):
     
     pos0 = meshArgs['faceStartAddr']
-    match = f.find(firstFace, pos0)
+    match = findBytes(f, firstFace, pos0)
     while match >= 0:
         if meshArgs['debug']:
             print("      Possible face start address: " + hex(match))
@@ -258,7 +266,7 @@ def findFaceStartAddr(f, nFace, nVert):
             pos += 6
         if iFail:
             pos0 = pos
-            match = f.find(firstFace, pos0)
+            match = findBytes(f, firstFace, pos0)
         else:
             if meshArgs['debug']:
                 print("      Found face start address: " + hex(match))
@@ -273,12 +281,12 @@ def findVertAddresses(f, faceSet):
     headerCatch=struct.pack('2I', 12, int(faceSet[0]['nVert']))  
     print("  Finding start of vertex header blocks...")
     offset = meshArgs['vertHeaderAddr']
-    match = f.find(headerCatch, offset)
+    match = findBytes(f, headerCatch, offset)
     while match >= 0:
         block = struct.unpack_from('16I', f, match)
         if block[14] == faceSet[0]['nVert']*4*3:
             break;
-        match = f.find(headerCatch, match+1)
+        match = findBytes(f, headerCatch, match+1)
     if match < 0:
         print("    FAIL: Could not find start of header info")
         return None
@@ -495,6 +503,62 @@ def writeObjFile(objFile, faceSet, vertSet, uvSet, normSet=None):
                             face[2], face[2], face[2]))
     file.close()
     
+#------------------------------------------------------------------------------
+def mapPhyre(inputFile):
+    # Memory map a file name, bytes-like objects (also memoryviews, which
+    # have no .find) are used as is and searched with findBytes
+    
+    if not isinstance(inputFile, str):
+        return inputFile
+    with open(inputFile, 'rb') as file:
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+#------------------------------------------------------------------------------
+def findFaceHeader(f, start=0x0):
+    # Address of the first valid face header block after start, None if
+    # there is none. Shared by extractFaceSets and probeMesh
+    
+    faceHeaderCatch=b'\xff\xff\xff\xff'
+    match = findBytes(f, faceHeaderCatch, start+1)
+    while match > 0:
+        block = struct.unpack_from('27I', f, match)
+        nFace = block[13]/3
+        nVert = block[12]+1
+        
+        valid = True
+        if nFace % 1 > 0: valid = False 
+        if nFace <= 0: valid = False
+        if nFace > 0xffff: valid = False # needs to fit in uint16
+        if nVert < 3: valid = False  # always at least 3 vertices
+        if nVert >= 0xffff: valid = False # needs to fit in uint16
+        if block[22] != 0: valid = False # face block offset (0 for first block)
+        if block[24] != nFace*2*3: valid = False # number of bytes in face block
+        
+        if valid:
+            return match
+        match = findBytes(f, faceHeaderCatch, match+1)
+    return None
+
+#------------------------------------------------------------------------------
+def probeMesh(inputFile):
+    # Face set statistics from the face header blocks only
+    
+    f = mapPhyre(inputFile)
+    pos = findFaceHeader(f)
+    if pos is None:
+        raise Exception("Faces could not be found")
+    sets = []
+    while pos + 27*4 <= len(f):
+        block = struct.unpack_from('27I', f, pos)
+        if block[0] != 0xffffffff:
+            break
+        sets.append({'nFace': int(block[13]/3), 'nVert': block[12]+1})
+        pos += 27*4
+    return {'sets': len(sets), \
+            'faces': sum(s['nFace'] for s in sets), \
+            'verts': sum(s['nVert'] for s in sets), \
+            'faceSets': sets}
+
 #------------------------------------------------------------------------------
 #------------------------------------------------------------------------------
 # DDS functions
@@ -510,8 +574,7 @@ def extractDDS(phyreFile, ddsFile, **kwargs):
     if isinstance(ddsArgs['ddsStartAddr'], str):
         ddsArgs['ddsStartAddr'] = int(ddsArgs['ddsStartAddr'], 16)
     
-    with open(phyreFile, 'rb') as myfile:
-        f = myfile.read()
+    f = readPhyre(phyreFile)
 
     if ddsArgs['encode'] is None:
         (ddsArgs['encode'], ddsArgs['ddsStartAddr']) = findEncoding(f)
@@ -540,17 +603,37 @@ def extractDDS(phyreFile, ddsFile, **kwargs):
     else:
         print("User provided number of mip maps: %d" % ddsArgs['mipMaps'])
 
+    skip = ddsArgs['mipSkip']
+    if skip < 0 or skip >= max(1, ddsArgs['mipMaps']):
+        raise Exception("mipSkip (%d) must be between 0 and number of mip maps (%d)" % (skip, ddsArgs['mipMaps']))
+    levelSizes = mipLevelSizes(ddsArgs['width'], ddsArgs['height'], ddsArgs['mipMaps'], ddsArgs['encode'])
+    dataAddr = ddsArgs['ddsStartAddr'] + sum(lvl[2] for lvl in levelSizes[:skip])
+    if skip > 0:
+        (ddsArgs['width'], ddsArgs['height']) = levelSizes[skip][0:2]
+        ddsArgs['mipMaps'] -= skip
+        print("Skipping %d mip maps, resolution: %dx%d" % (skip, ddsArgs['width'], ddsArgs['height']))
+
     header=buildHeader()
     with open(ddsFile, 'wb') as myfile:
-        myfile.write(header + f[ddsArgs['ddsStartAddr']:])
+        myfile.write(header + f[dataAddr:])
     print("File written to: " + ddsFile)
     
+#------------------------------------------------------------------------------
+def probeDDS(phyreFile):
+    # Texture encoding, resolution and mip count from the header only
+    
+    f = mapPhyre(phyreFile)
+    (encoding, startAddr) = findEncoding(f)
+    (width, height, mips) = getHeaderData(f)
+    return {'encode': encoding, 'width': width, 'height': height, 'mips': mips, \
+            'dataSize': len(f) - startAddr}
+
 #------------------------------------------------------------------------------
 def findEncoding(dds_data):
     # Determine encoding by searching data structure
     
     for key, value in encode0.items():
-        s = dds_data.find(str.encode(key))
+        s = findBytes(dds_data, str.encode(key))
         if s >= 0:
             startaddr = s + len(key) + 0x26
             return (key, startaddr)
@@ -561,7 +644,7 @@ def getHeaderData(f):
     # Find resolution and number of mip maps
     import math
 
-    match = f.find(b"PS3Data")
+    match = findBytes(f, b"PS3Data")
     if match<0:
         raise Exception("Could not find start of header data")
     pos = match+16*3
@@ -578,6 +661,23 @@ def getHeaderData(f):
         print("WARN: More mipmaps than expected")
     return(width, height, mips)
     
+#------------------------------------------------------------------------------
+def mipLevelSizes(width, height, mips, encoding):
+    # (width, height, bytes) of each mip level, largest first
+    
+    enc = encode0[encoding]
+    levels = []
+    for i in range(max(1, mips)):
+        w = max(1, width >> i)
+        h = max(1, height >> i)
+        if encoding[0:3] == 'DXT':
+            # 4x4 blocks, bbp bits per pixel
+            size = max(1, (w+3)//4) * max(1, (h+3)//4) * enc['bbp']*2
+        else:
+            size = w * h * enc['bbp']//8
+        levels.append((w, h, size))
+    return levels
+
 #------------------------------------------------------------------------------
 def buildHeader():  
     # build DDS header, assume DXT5
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+# Reader for the FFX_Data.vbf archive (layout as used by
+# https://github.com/topher-au/VBFTool). Header:
+#   uint32 magic 'SRYK', uint32 header length, uint64 number of files
+#   16 byte md5 of every file name
+#   per file: uint32 first block, uint32 unknown, uint64 size,
+#             uint64 data offset, uint64 name offset
+#   uint32 name table length (incl. this field) + null terminated names
+#   uint16 stored size of every 64k block up to the header length
+# A block is stored raw when its stored size is 0 (full 64k block) or equal
+# to its original size, otherwise it is zlib compressed.
+
+import logging
+import mmap
+import os
+import struct
+import zlib
+
+VBF_MAGIC = 0x4B595253
+BLOCK_SIZE = 0x10000
+
+
+class VbfArchive:
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = open(path, 'rb')
+        self._mm = mmap.mmap(self._fd.fileno(), 0, access=mmap.ACCESS_READ)
+        self.entries = self._read_index()
+
+    def _read_index(self):
+        mm = self._mm
+        magic, header_len, num_files = struct.unpack_from('<IIQ', mm, 0)
+        if magic != VBF_MAGIC:
+            raise ValueError('Not a vbf archive', self.path)
+        pos = 16 + 16 * num_files
+        table = [struct.unpack_from('<IIQQQ', mm, pos + 32 * i) for i in range(num_files)]
+        pos += 32 * num_files
+        names_len = struct.unpack_from('<I', mm, pos)[0]
+        names = mm[pos + 4:pos + names_len]
+        pos += names_len
+        self._blocks = struct.unpack_from('<%dH' % ((header_len - pos) // 2), mm, pos)
+        entries = {}
+        for block, _, size, offset, name_offset in table:
+            name = names[name_offset:names.index(b'\0', name_offset)].decode()
+            entries[name] = {'name': name, 'block': block, 'size': size, 'offset': offset,
+                             'blocks': max(1, -(-size // BLOCK_SIZE))}
+        logging.info('Read vbf index, path={} files={}'.format(self.path, len(entries)))
+        return entries
+
+    def close(self):
+        # views returned by view() keep the mapping alive, it is unmapped
+        # when the last of them is released
+        try:
+            self._mm.close()
+        except BufferError:
+            logging.info('Vbf views still in use, path=' + self.path)
+        self._fd.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def names(self, prefix=''):
+        return [n for n in self.entries if n.startswith(prefix)]
+
+    def find(self, suffix):
+        # full name of the entry ending with `suffix`, e.g. 'chr/mon/m001/mdl/d3d11/m001.dae.phyre'
+        matches = [n for n in self.entries if n.endswith(suffix)]
+        if len(matches) != 1:
+            raise KeyError('Expected one entry matching', suffix, len(matches))
+        return matches[0]
+
+    def _block_sizes(self, entry):
+        # (stored, original) size of every block of an entry
+        sizes = []
+        remaining = entry['size']
+        for i in range(entry['blocks']):
+            original = min(BLOCK_SIZE, remaining)
+            stored = self._blocks[entry['block'] + i]
+            sizes.append((BLOCK_SIZE if stored == 0 else stored, original))
+            remaining -= original
+        return sizes
+
+    def is_stored(self, name):
+        # True when no block of the entry is compressed
+        return all(s == o for s, o in self._block_sizes(self.entries[name]))
+
+    def view(self, name):
+        # Zero-copy memoryview into the mapped archive for stored entries,
+        # decompressed bytes otherwise. Views stay valid after close()
+        entry = self.entries[name]
+        pos = entry['offset']
+        if self.is_stored(name):
+            return memoryview(self._mm)[pos:pos + entry['size']]
+        out = bytearray()
+        for stored, original in self._block_sizes(entry):
+            block = self._mm[pos:pos + stored]
+            out += block if stored == original else zlib.decompress(block)
+            pos += stored
+        return memoryview(out)
+
+    def extract(self, name, dst_path):
+        os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+        with open(dst_path, 'wb') as fd:
+            fd.write(self.view(name))
+        return dst_path
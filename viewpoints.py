@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+import mesh_lod
+
+
+def to_blender(verts):
+    # obj (x, y, z) to blender (x, -z, y), the axes the obj importer uses by
+    # default (forward -Z, up Y)
+    return np.stack([verts[:, 0], -verts[:, 2], verts[:, 1]], axis=1)
+
+
+def view_stats(verts, faces, angles, grid=32):
+    # verts in blender space (see to_blender)
+    # Per candidate camera angle (degrees around z, camera as in
+    # blender_render.setup_scene): silhouette occupancy grid and the
+    # fraction of surface area facing the camera. All angles at once.
+    theta = np.radians(np.asarray(angles, dtype=np.float64))
+    dirs = np.stack([np.sin(theta), np.cos(theta), np.zeros_like(theta)], axis=1)   # towards camera
+    horiz = np.stack([np.cos(theta), -np.sin(theta), np.zeros_like(theta)], axis=1)  # image x axis
+    tri = verts[faces]
+    cross = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+    area = np.linalg.norm(cross, axis=1) / 2
+    normals = cross / np.maximum(2 * area, 1e-12)[:, None]
+    facing = np.maximum(normals @ dirs.T, 0.0)                                     # (faces, angles)
+    coverage = (area[:, None] * (facing > 0)).sum(axis=0) / max(area.sum(), 1e-12)
+    projected = (area[:, None] * facing).sum(axis=0)
+    # silhouette: front facing face centroids binned on an image grid that is
+    # the same for every angle (model bounding sphere)
+    centers = tri.mean(axis=1) - verts.mean(axis=0)
+    radius = max(np.linalg.norm(centers, axis=1).max(), 1e-12)
+    x = ((centers @ horiz.T) / radius + 1) / 2 * (grid - 1)
+    y = np.repeat((((centers[:, 2]) / radius + 1) / 2 * (grid - 1))[:, None], len(angles), axis=1)
+    cells = np.rint(y).astype(np.int64) * grid + np.rint(x).astype(np.int64)
+    cells = cells + np.arange(len(angles))[None, :] * grid * grid
+    occupancy = np.zeros(len(angles) * grid * grid, dtype=bool)
+    occupancy[cells[facing > 0]] = True
+    occupancy = occupancy.reshape(len(angles), grid * grid)
+    return {'silhouette': occupancy.mean(axis=1), 'coverage': coverage,
+            'projected': projected, 'occupancy': occupancy}
+
+
+def select(verts, faces, angles, k=8, max_iou=0.9):
+    # Top-k angles by silhouette area x projected visible surface, skipping
+    # angles whose silhouette is nearly the same as an already selected one
+    stats = view_stats(verts, faces, angles)
+    score = stats['silhouette'] / max(stats['silhouette'].max(), 1e-12) \
+        * stats['projected'] / max(stats['projected'].max(), 1e-12)
+    occ = stats['occupancy']
+    chosen = []
+    for i in np.argsort(-score, kind='stable'):
+        if stats['coverage'][i] == 0:
+            break
+        similar = False
+        for j in chosen:
+            # mirrored views (e.g. 15 and 345) give mirrored silhouettes
+            mirrored = occ[j].reshape(-1, int(np.sqrt(occ.shape[1])))[:, ::-1].reshape(-1)
+            for other in (occ[j], mirrored):
+                union = np.logical_or(occ[i], other).sum()
+                if union and np.logical_and(occ[i], other).sum() / union > max_iou:
+                    similar = True
+        if not similar:
+            chosen.append(i)
+        if len(chosen) == k:
+            break
+    return [angles[i] for i in chosen]
+
+
+def select_for_obj(obj_path, angles, k=8, max_iou=0.9):
+    verts, _, groups = mesh_lod.read_obj(obj_path)
+    faces = np.vstack([f for _, f in groups])
+    return select(to_blender(verts), faces, angles, k, max_iou)